@@ -0,0 +1,65 @@
+"""
+Import hikarichat outside of Hikka for benchmarks.
+
+Hikka package and third-party dependencies are replaced with stub modules,
+which return placeholder classes for any attribute. Only pure-Python helpers
+of hikarichat (matchers, counters, caches) are meant to be used from it.
+"""
+
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBBED = ("telethon", "aiogram", "websockets", "aiohttp", "requests", "hikka")
+
+
+class _Stub(types.ModuleType):
+    __path__ = []
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        if self.__name__ == "hikka":
+            return importlib.import_module(f"hikka.{name}")
+
+        value = type(name, (), {"__init__": lambda self, *args, **kwargs: None})
+        setattr(self, name, value)
+        return value
+
+
+class _StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split(".")[0] in STUBBED:
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+
+        return None
+
+    def create_module(self, spec):
+        return _Stub(spec.name)
+
+    def exec_module(self, module):
+        if module.__name__ == "hikka.loader":
+            module.tds = lambda cls: cls
+            module.Module = type("Module", (), {})
+
+
+def load() -> types.ModuleType:
+    """Import hikarichat.py as hikka.modules.hikarichat"""
+    if "hikka.modules.hikarichat" in sys.modules:
+        return sys.modules["hikka.modules.hikarichat"]
+
+    sys.meta_path.insert(0, _StubFinder())
+    spec = importlib.util.spec_from_file_location(
+        "hikka.modules.hikarichat",
+        os.path.join(ROOT, "hikarichat.py"),
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,127 @@
+"""
+AntiExplicit throughput: inline re.findall (before) vs ExplicitMatcher.check
+
+    python benchmarks/bench_antiexplicit.py [messages]
+"""
+
+import random
+import re
+import sys
+import time
+
+import _hikarichat
+
+hikarichat = _hikarichat.load()
+
+EXCLUSIONS = ["хулиган", "гребля", "употреб", "оскорбл", "рубл", "стебел"]
+
+WORDS = (
+    "привет как дела что нового сегодня завтра встреча чат бот админ модуль "
+    "hello world today meeting release update docs link thanks please ok "
+    "хулиган гребля употреблять рубль стебель оскорблять скидка канал подписка"
+).split()
+EXPLICIT = ["бля", "хуйня", "пиздец", "ебать", "мудак", "залупа", "пидор"]
+
+
+def corpus(size: int, seed: int = 0) -> list:
+    """Chat-like messages, some explicit, with repeating spam waves"""
+    rnd = random.Random(seed)
+    spam = [
+        " ".join(rnd.choices(WORDS + EXPLICIT, k=rnd.randint(3, 12)))
+        for _ in range(50)
+    ]
+    messages = []
+    for _ in range(size):
+        if rnd.random() < 0.3:
+            messages += [rnd.choice(spam)]
+            continue
+
+        words = rnd.choices(WORDS, k=rnd.randint(1, 30))
+        if rnd.random() < 0.15:
+            words.insert(rnd.randrange(len(words) + 1), rnd.choice(EXPLICIT))
+
+        messages += [" ".join(words)]
+
+    return messages
+
+
+def legacy_check(text: str, exclusions: list) -> bool:
+    """p__antiexplicit before compiled matcher was introduced"""
+    P = "пПnPp"
+    I = "иИiI1uІИ́Їіи́ї"  # noqa: E741
+    E = "еЕeEЕ́е́"
+    D = "дДdD"
+    Z = "зЗ3zZ3"
+    M = "мМmM"
+    U = "уУyYuUУ́у́"
+    O = "оОoO0О́о́"  # noqa: E741
+    L = "лЛlL1"
+    A = "аАaAА́а́@"
+    N = "нНhH"
+    G = "гГgG"
+    K = "кКkK"
+    R = "рРpPrR"
+    H = "хХxXhH"
+    YI = "йЙyуУY"
+    YA = "яЯЯ́я́"
+    YO = "ёЁ"
+    YU = "юЮЮ́ю́"
+    B = "бБ6bB"
+    T = "тТtT1"
+    HS = "ъЪ"
+    SS = "ьЬ"
+    Y = "ыЫ"
+
+    occurrences = re.findall(
+        rf"""\b[0-9]*(\w*[{P}][{I}{E}][{Z}][{D}]\w*|(?:[^{I}{U}\s]+|{N}{I})?(?<!стра)[{H}][{U}][{YI}{E}{YA}{YO}{I}{L}{YU}](?!иг)\w*|\w*[{B}][{L}](?:[{YA}]+[{D}{T}]?|[{I}]+[{D}{T}]+|[{I}]+[{A}]+)(?!х)\w*|(?:\w*[{YI}{U}{E}{A}{O}{HS}{SS}{Y}{YA}][{E}{YO}{YA}{I}][{B}{P}](?!ы\b|ол)\w*|[{E}{YO}][{B}]\w*|[{I}][{B}][{A}]\w+|[{YI}][{O}][{B}{P}]\w*)|\w*(?:[{P}][{I}{E}][{D}][{A}{O}{E}]?[{R}](?!о)\w*|[{P}][{E}][{D}][{E}{I}]?[{G}{K}])|\w*[{Z}][{A}{O}][{L}][{U}][{P}]\w*|\w*[{M}][{A}][{N}][{D}][{A}{O}]\w*|\w*[{G}][{O}{A}][{N}][{D}][{O}][{N}]\w*)""",
+        text,
+    )
+
+    return bool(
+        [
+            word
+            for word in occurrences
+            if all(excl not in word for excl in exclusions)
+        ]
+    )
+
+
+def measure(name: str, check, messages: list) -> list:
+    start = time.perf_counter()
+    verdicts = [check(text) for text in messages]
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<28} {len(messages) / elapsed:>12,.0f} msg/s"
+        f"  ({elapsed * 1000:.1f} ms, {sum(verdicts)} explicit)"
+    )
+    return verdicts
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    messages = corpus(size)
+    print(f"{size} messages, {len(set(messages))} unique\n")
+
+    before = measure(
+        "inline re.findall",
+        lambda text: legacy_check(text, EXCLUSIONS),
+        messages,
+    )
+
+    matcher = hikarichat.ExplicitMatcher(EXCLUSIONS)
+    cold = measure("ExplicitMatcher (cold)", matcher.check, messages)
+    warm = measure("ExplicitMatcher (warm)", matcher.check, messages)
+
+    uncached = hikarichat.ExplicitMatcher(EXCLUSIONS, cache_size=0)
+    no_cache = measure("ExplicitMatcher (no cache)", uncached.check, messages)
+
+    mismatches = sum(
+        a != b or a != c or a != d for a, b, c, d in zip(before, cold, warm, no_cache)
+    )
+    print(f"\nverdict mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+AntiFlood counters: nested str-keyed lists (before) vs FloodCounter
+
+    python benchmarks/bench_antiflood.py [senders]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+import types
+
+import _hikarichat
+
+hikarichat = _hikarichat.load()
+
+CHATS = 200
+MESSAGES_PER_SENDER = 3
+FLOODERS = 20
+TICK = 0.01  # simulated seconds between two messages
+
+
+def workload(senders: int, seed: int = 0) -> list:
+    """(timestamp, chat_id, user_id) for distinct senders with flood bursts"""
+    rnd = random.Random(seed)
+    events = [
+        (rnd.randrange(CHATS), user_id)
+        for user_id in range(senders)
+        for _ in range(MESSAGES_PER_SENDER)
+    ]
+    rnd.shuffle(events)
+
+    for _ in range(len(events) // 100):
+        chat_id = rnd.randrange(CHATS)
+        user_id = senders + rnd.randrange(FLOODERS)
+        position = rnd.randrange(len(events))
+        events[position:position] = [(chat_id, user_id)] * 5
+
+    return [
+        (round(i * TICK, 2), chat_id, user_id)
+        for i, (chat_id, user_id) in enumerate(events)
+    ]
+
+
+def legacy_hit(cache: dict, now: float, chat_id: int, user_id: int) -> bool:
+    """p__antiflood before FloodCounter was introduced"""
+    if str(chat_id) not in cache:
+        cache[str(chat_id)] = {}
+
+    if str(user_id) not in cache[str(chat_id)]:
+        cache[str(chat_id)][str(user_id)] = []
+
+    for item in cache[str(chat_id)][str(user_id)].copy():
+        if now - item > hikarichat.FLOOD_TIMEOUT:
+            cache[str(chat_id)][str(user_id)].remove(item)
+
+    cache[str(chat_id)][str(user_id)].append(round(now, 2))
+    return len(cache[str(chat_id)][str(user_id)]) >= hikarichat.FLOOD_TRESHOLD
+
+
+class CountingFloodCounter(hikarichat.FloodCounter):
+    """FloodCounter, which tells apart sweep and size cap evictions"""
+
+    inserted = 0
+    swept = 0
+    peak = 0
+
+    def hit(self, chat_id: int, user_id: int) -> bool:
+        self.inserted += (chat_id, user_id) not in self._windows
+        result = super().hit(chat_id, user_id)
+        self.peak = max(self.peak, len(self))
+        return result
+
+    def sweep(self, now: float = None) -> None:
+        before = len(self)
+        super().sweep(now)
+        self.swept += before - len(self)
+
+    @property
+    def capped(self) -> int:
+        return self.inserted - self.swept - len(self)
+
+
+def new_counter(cls=hikarichat.FloodCounter, max_size: int = 10000):
+    return cls(hikarichat.FLOOD_TIMEOUT, hikarichat.FLOOD_TRESHOLD, max_size)
+
+
+def run_legacy(events: list) -> tuple:
+    cache = {}
+    verdicts = [legacy_hit(cache, *event) for event in events]
+    return cache, verdicts
+
+
+def run_counter(events: list, counter) -> tuple:
+    clock = [0.0]
+    real_time = hikarichat.time
+    hikarichat.time = types.SimpleNamespace(time=lambda: clock[0])
+    try:
+        verdicts = []
+        for now, chat_id, user_id in events:
+            clock[0] = now
+            verdicts += [counter.hit(chat_id, user_id)]
+    finally:
+        hikarichat.time = real_time
+
+    return counter, verdicts
+
+
+def timed(name: str, run, events: list) -> list:
+    start = time.perf_counter()
+    _, verdicts = run(events)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<24} {len(events) / elapsed:>12,.0f} msg/s"
+        f"  ({elapsed * 1000:.1f} ms, {sum(verdicts)} flood hits)"
+    )
+    return verdicts
+
+
+def retained(run, events: list) -> int:
+    """Bytes still allocated by the state built during the run"""
+    tracemalloc.start()
+    state, verdicts = run(events)
+    del verdicts
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del state
+    return size
+
+
+def entries(cache: dict) -> int:
+    return sum(len(users) for users in cache.values())
+
+
+def main() -> None:
+    senders = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = workload(senders)
+    print(
+        f"{senders} distinct senders, {len(events)} messages over"
+        f" {events[-1][0]:.0f} simulated seconds\n"
+    )
+
+    before = timed("nested str-keyed lists", run_legacy, events)
+    after = timed(
+        "FloodCounter",
+        lambda events: run_counter(events, new_counter()),
+        events,
+    )
+
+    cache, _ = run_legacy(events)
+    print(f"\ntracked users (legacy) {entries(cache):>10,}\n")
+    print(f"{'cap':>8} {'peak':>8} {'final':>8} {'swept':>10} {'capped':>10}")
+    for max_size in (10000, 1000, 100):
+        counter, verdicts = run_counter(
+            events, new_counter(CountingFloodCounter, max_size)
+        )
+        print(
+            f"{max_size:>8,} {counter.peak:>8,} {len(counter):>8,}"
+            f" {counter.swept:>10,} {counter.capped:>10,}"
+            f"  ({sum(a != b for a, b in zip(before, verdicts))} verdicts differ)"
+        )
+        if counter.peak > max_size:
+            sys.exit(1)
+
+    legacy_bytes = retained(run_legacy, events)
+    counter_bytes = retained(lambda events: run_counter(events, new_counter()), events)
+    print(
+        f"\nretained memory (legacy)  {legacy_bytes / 2**20:>8.1f} MiB"
+        f"\nretained memory (counter) {counter_bytes / 2**20:>8.1f} MiB"
+    )
+
+    mismatches = sum(a != b for a, b in zip(before, after))
+    print(f"\nverdict mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+HikariChat delta updates: correctness of apply_patches / apply_delta and cost
+of applying a delta to a large state
+
+    python benchmarks/check_delta.py [chats]
+"""
+
+import copy
+import sys
+import time
+
+import _hikarichat
+
+hikarichat = _hikarichat.load()
+
+ME = 1
+
+
+class Snapshot:
+    dirty = 0
+
+    def mark_dirty(self) -> None:
+        self.dirty += 1
+
+
+def state(chats: int) -> dict:
+    return {
+        "chats": {
+            str(-100 - i): {
+                "antiflood": ["ban", str(ME)],
+                "antiarab": ["mute", str(ME)],
+                "antigif": ["delete", "2"],
+            }
+            for i in range(chats)
+        },
+        "feds": {
+            "fed": {
+                "chats": [str(-100 - i) for i in range(chats)],
+                "fdef": ["10"],
+                "warns": {"20": ["spam"]},
+                "notes": {},
+            }
+        },
+    }
+
+
+def api(chats: int):
+    instance = hikarichat.HikariChatAPI()
+    initial = state(chats)
+    instance.chats, instance.feds = initial["chats"], initial["feds"]
+    instance._me = ME
+    instance._version = 1
+    instance._snapshot = Snapshot()
+    instance._dispatch = {}
+    instance._notes = {}
+    instance._note_payloads = {}
+    instance._warns = {}
+    instance.rebuild_dispatch()
+    instance.rebuild_feds_index()
+    instance.rebuild_warns()
+    return instance
+
+
+def check(name: str, condition: bool) -> bool:
+    print(f"{'ok' if condition else 'FAIL':<6} {name}")
+    return condition
+
+
+def correctness() -> bool:
+    results = []
+
+    original = state(3)
+    pristine = copy.deepcopy(original)
+    patched = hikarichat.apply_patches(
+        original,
+        [
+            {"op": "set", "path": ["chats", "-100", "antiflood"], "value": None},
+            {"op": "delete", "path": ["chats", "-101"]},
+            {"op": "append", "path": ["feds", "fed", "warns", "20"], "value": "x"},
+            {"op": "append", "path": ["feds", "fed", "warns", "30"], "value": "y"},
+            {"op": "set", "path": ["feds", "new", "chats"], "value": []},
+        ],
+    )
+    results += [
+        check("apply_patches leaves original untouched", original == pristine),
+        check(
+            "apply_patches applies every operation",
+            patched["chats"]["-100"]["antiflood"] is None
+            and "-101" not in patched["chats"]
+            and patched["feds"]["fed"]["warns"] == {"20": ["spam", "x"], "30": ["y"]}
+            and patched["feds"]["new"] == {"chats": []},
+        ),
+        check(
+            "apply_patches shares untouched subtrees",
+            patched["chats"]["-102"] is original["chats"]["-102"],
+        ),
+    ]
+
+    instance = api(3)
+    ok = instance.apply_delta(
+        {
+            "base": 1,
+            "version": 2,
+            "patches": [
+                {"op": "delete", "path": ["chats", "-100", "antiflood"]},
+                {"op": "append", "path": ["feds", "fed", "fdef"], "value": "11"},
+                {"op": "append", "path": ["feds", "fed", "warns", "20"], "value": "x"},
+            ],
+        }
+    )
+    results += [
+        check(
+            "apply_delta updates state and indexes",
+            ok
+            and instance._version == 2
+            and "antiflood" not in instance.chats["-100"]
+            and instance._dispatch[-100] == ("antiarab",)
+            and instance._fdef["fed"] == {10, 11}
+            and len(instance.warns("fed", 20)) == 2
+            and instance._snapshot.dirty == 1,
+        )
+    ]
+
+    instance = api(3)
+    before = copy.deepcopy((instance.chats, instance.feds))
+    dispatch = dict(instance._dispatch)
+    ok = instance.apply_delta(
+        {
+            "base": 1,
+            "version": 2,
+            "patches": [
+                {"op": "delete", "path": ["chats", "-100", "antiflood"]},
+                {"op": "append", "path": ["feds", "fed", "fdef"], "value": "11"},
+                {"op": "append", "path": ["feds", "fed", "chats", "0"], "value": "x"},
+            ],
+        }
+    )
+    results += [
+        check(
+            "failed apply_delta keeps state and asks for snapshot",
+            not ok
+            and instance._version is None
+            and (instance.chats, instance.feds) == before
+            and instance._dispatch == dispatch
+            and instance._snapshot.dirty == 0,
+        ),
+        check(
+            "stale apply_delta is rejected",
+            not api(3).apply_delta({"base": 0, "version": 2, "patches": []}),
+        ),
+    ]
+
+    return all(results)
+
+
+def throughput(chats: int) -> None:
+    instance = api(chats)
+    runs = 1000
+    start = time.perf_counter()
+    for version in range(1, runs + 1):
+        instance.apply_delta(
+            {
+                "base": version,
+                "version": version + 1,
+                "patches": [
+                    {
+                        "op": "set",
+                        "path": ["chats", str(-100 - version % chats), "antiflood"],
+                        "value": ["mute", str(ME)],
+                    }
+                ],
+            }
+        )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"\n{chats} chats: {runs / elapsed:,.0f} single-patch deltas/s"
+        f"  ({elapsed / runs * 1e6:.1f} us each)"
+    )
+
+
+def main() -> None:
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    if not correctness():
+        sys.exit(1)
+
+    throughput(chats)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,13 +21,17 @@ __version__ = (10, 0, 2)
 
 import re
 import io
+import os
 import abc
 import time
 import json
 import imghdr
 import logging
 import asyncio
+import bisect
+import hashlib
 import functools
+import collections
 import websockets
 import aiohttp
 
@@ -48,23 +52,48 @@ from telethon.tl.types import (
     UserStatusOnline,
     ChatBannedRights,
     ChannelParticipantCreator,
+    ChannelParticipantAdmin,
+    ChannelParticipantsAdmins,
+    ChannelParticipantsSearch,
+    ChatParticipantAdmin,
+    ChatParticipantCreator,
     ChatAdminRights,
+    UpdateChannelParticipant,
+    UpdateChatParticipantAdmin,
+    UpdateUserName,
+    UpdateChannel,
+    InputPeerUser,
+    InputPeerChat,
+    InputPeerChannel,
+    InputUser,
+    InputChannel,
 )
 
 from types import FunctionType
-from typing import Union, List
+from typing import Any, Awaitable, Callable, Union, List
 from aiogram.types import CallbackQuery
 from .. import loader, utils, main
 
-from telethon.errors import UserAdminInvalidError, ChatAdminRequiredError
+import telethon
+from telethon import events
+
+from telethon.errors import (
+    UserAdminInvalidError,
+    FloodWaitError,
+)
 
 from telethon.tl.functions.channels import (
     EditBannedRequest,
+    GetChannelsRequest,
     GetParticipantRequest,
+    GetParticipantsRequest,
     InviteToChannelRequest,
     EditAdminRequest,
 )
 
+from telethon.tl.functions.messages import GetChatsRequest
+from telethon.tl.functions.users import GetUsersRequest
+
 from math import ceil
 import requests
 
@@ -73,9 +102,26 @@ try:
 except ImportError:
     PIL_AVAILABLE = False
 else:
-    font = requests.get("https://github.com/hikariatama/assets/raw/master/EversonMono.ttf").content  # fmt: skip
     PIL_AVAILABLE = True
 
+FONT_URL = "https://github.com/hikariatama/assets/raw/master/EversonMono.ttf"
+FONT_PATH = "EversonMono.ttf"
+# Expected sha256 of font at FONT_URL. If it's not pinned, downloaded font is
+# only accepted after it's successfully parsed
+FONT_SHA256 = None
+FALLBACK_FONTS = [
+    "DejaVuSansMono.ttf",
+    "LiberationMono-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "cour.ttf",
+]
+
+_font = None
+
+TABLE_PAGE_ROWS = 50
+TABLE_CACHE_SIZE = 16
+_pages_cache = collections.OrderedDict()
+
 
 def chunks(_list: Union[list, tuple, set], n: int, /) -> list:
     """Split provided `_list` into chunks of `n`"""
@@ -91,6 +137,44 @@ ver = f"<u>HikariChat {version}</u>"
 FLOOD_TIMEOUT = 0.8
 FLOOD_TRESHOLD = 4
 
+OUTBOX_SIZE = 1000
+OUTBOX_BATCH = 50
+OUTBOX_WINDOW = 0.25
+
+HTTP_LIMIT_PER_HOST = 8
+HTTP_CONCURRENCY = 16
+HTTP_TIMEOUT = 15
+
+FLOOD_WAIT_MAX = 60
+
+RESOLVE_BATCH = 100
+
+# Upper bounds of latency histogram buckets, 50us to ~70s
+LATENCY_BUCKETS = tuple(0.00005 * 1.25**i for i in range(64))
+
+RPC_CRITICAL = 0
+RPC_NORMAL = 1
+RPC_LOW = 2
+RPC_QUEUE_SIZE = 500
+RPC_WORKERS = 4
+# method: (calls per second, burst, priority)
+RPC_METHODS = {
+    "delete": (30, 30, RPC_CRITICAL),
+    "ban": (20, 20, RPC_CRITICAL),
+    "kick": (20, 20, RPC_CRITICAL),
+    "send": (20, 20, RPC_LOW),
+    "log": (5, 5, RPC_LOW),
+    "resolve": (10, 10, RPC_NORMAL),
+}
+RPC_DEFAULT = (10, 10, RPC_NORMAL)
+
+SWEEP_WORKERS = 8
+SWEEP_PAGE = 200
+SWEEP_PROGRESS_INTERVAL = 5
+
+NSFW_MAX_BYTES = 2 * 1024 * 1024
+NSFW_MIN_SIDE = 320
+
 
 def get_link(user: User or Channel) -> str:
     """Get link to object (User or Channel)"""
@@ -125,6 +209,28 @@ PROTECTS = {
 }
 
 
+# Order in which `watcher` dispatches protections. Each protection maps to
+# (violation name or None, pass chat entity, delete message on trigger,
+# runs on service messages)
+DISPATCH_ORDER = {
+    "banninja": (None, True, False, True),
+    "antiraid": (None, True, False, True),
+    "antiarab": ("arabic_nickname", False, False, True),
+    "antizalgo": ("zalgo", False, False, True),
+    "welcome": (None, True, False, True),
+    "report": (None, False, False, False),
+    "antiflood": ("flood", False, True, False),
+    "antichannel": (None, False, False, False),
+    "antigif": (None, False, False, False),
+    "antistick": ("stick", False, False, False),
+    "antispoiler": (None, False, False, False),
+    "antiexplicit": ("explicit", False, True, False),
+    "antinsfw": ("nsfw_content", False, False, False),
+    "antitagall": ("tagall", False, True, False),
+    "antihelp": (None, False, False, False),
+}
+
+
 API_FEATURES = {
     "clrallwarns",
     "clrwarns",
@@ -181,33 +287,148 @@ def fit(line, max_size):
     return f"{' ' * ceil(offsets_sum / 2 - 1)}{line}{' ' * int(offsets_sum / 2 - 1)}"
 
 
-def gen_table(t: List[List[str]]) -> bytes:
-    table = ""
-    header = t[0]
-    rows_sizes = [len(i) + 2 for i in header]
+def table_sizes(t: List[List[str]]) -> List[int]:
+    """Get columns widths of table in one pass"""
+    sizes = [len(cell) + 2 for cell in t[0]]
     for row in t[1:]:
-        rows_sizes = [max(len(j) + 2, rows_sizes[i]) for i, j in enumerate(row)]
+        for i, cell in enumerate(row):
+            if len(cell) + 2 > sizes[i]:
+                sizes[i] = len(cell) + 2
+
+    return sizes
+
+
+def gen_table(t: List[List[str]], sizes: Union[List[int], None] = None) -> str:
+    if sizes is None:
+        sizes = table_sizes(t)
+
+    lines = ["━" * size for size in sizes]
+    separator = f"\n┠{'┼'.join('─' * size for size in sizes)}┫\n"
+
+    return (
+        f"┏{'┯'.join(lines)}┓\n"
+        + separator.join(
+            f"┃⁣⁣ {' ┃⁣⁣ '.join(fit(cell, sizes[k]) for k, cell in enumerate(row))} ┃⁣⁣"
+            for row in t
+        )
+        + f"\n┗{'┷'.join(lines)}┛\n"
+    )
+
+
+def paginate_table(
+    t: List[List[str]],
+    rows_per_page: int = TABLE_PAGE_ROWS,
+) -> List[str]:
+    """Split table into text pages, each with header and the same column widths"""
+    sizes = table_sizes(t)
+    return [
+        gen_table([t[0]] + page, sizes)
+        for page in chunks(t[1:], rows_per_page) or [[]]
+    ]
+
+
+def _valid_font(data: bytes) -> bool:
+    """Check, that data is the expected font and it can be parsed"""
+    if FONT_SHA256 is not None and hashlib.sha256(data).hexdigest() != FONT_SHA256:
+        return False
+
+    try:
+        ImageFont.truetype(io.BytesIO(data), 20, encoding="utf-8")
+    except Exception:
+        return False
+
+    return True
+
+
+def _drop_font_cache() -> None:
+    for path in (FONT_PATH, f"{FONT_PATH}.sha256"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.debug(f"Can't remove {path}", exc_info=True)
+
+
+def _read_font_cache() -> Union[bytes, None]:
+    """Read cached font, if it's not corrupted"""
+    try:
+        with open(FONT_PATH, "rb") as f:
+            data = f.read()
+
+        with open(f"{FONT_PATH}.sha256", "r") as f:
+            checksum = f.read().strip()
+    except Exception:
+        return None
+
+    if hashlib.sha256(data).hexdigest() != checksum or (
+        FONT_SHA256 is not None and checksum != FONT_SHA256
+    ):
+        _drop_font_cache()
+        return None
+
+    return data
+
 
-    rows_lines = ["━" * i for i in rows_sizes]
+def _download_font() -> Union[bytes, None]:
+    try:
+        response = requests.get(FONT_URL, timeout=10)
+        response.raise_for_status()
+        data = response.content
+    except Exception:
+        logger.debug("Can't download font", exc_info=True)
+        return None
 
-    table += f"┏{('┯'.join(rows_lines))}┓\n"
+    if not _valid_font(data):
+        logger.debug("Downloaded font is invalid, not caching it")
+        return None
 
-    for line in t:
-        table += f"┃⁣⁣ {' ┃⁣⁣ '.join([fit(row, rows_sizes[k]) for k, row in enumerate(line)])} ┃⁣⁣\n"
-        table += "┠"
+    try:
+        with open(FONT_PATH, "wb") as f:
+            f.write(data)
 
-        for row in rows_sizes:
-            table += f"{'─' * row}┼"
+        with open(f"{FONT_PATH}.sha256", "w") as f:
+            f.write(hashlib.sha256(data).hexdigest())
+    except Exception:
+        logger.debug("Can't cache font", exc_info=True)
+
+    return data
+
+
+def get_font() -> "ImageFont.FreeTypeFont":
+    """
+    Get table font. It's downloaded on first use only and cached on disk.
+    Falls back to system monospace font if it's unavailable
+    """
+    global _font
+
+    if _font is not None:
+        return _font
+
+    data = _read_font_cache() or _download_font()
+    if data:
+        try:
+            _font = ImageFont.truetype(io.BytesIO(data), 20, encoding="utf-8")
+            return _font
+        except Exception:
+            logger.debug("Can't parse font, dropping cache", exc_info=True)
+            _drop_font_cache()
 
-        table = table[:-1] + "┫\n"
+    for fallback in FALLBACK_FONTS:
+        try:
+            _font = ImageFont.truetype(fallback, 20, encoding="utf-8")
+            return _font
+        except Exception:
+            pass
 
-    return "\n".join(table.splitlines()[:-1]) + "\n" + f"┗{('┷'.join(rows_lines))}┛\n"
+    _font = ImageFont.load_default()
+    return _font
 
 
-def render_table(t: List[List[str]]) -> bytes:
-    table = gen_table(t)
+def render_table(t: Union[List[List[str]], str]) -> bytes:
+    table = t if isinstance(t, str) else gen_table(t)
 
-    fnt = ImageFont.truetype(io.BytesIO(font), 20, encoding="utf-8")
+    fnt = get_font()
 
     def get_t_size(text, fnt):
         if "\n" not in text:
@@ -239,6 +460,24 @@ def render_table(t: List[List[str]]) -> bytes:
     return imgByteArr
 
 
+def render_table_pages(
+    t: List[List[str]],
+    rows_per_page: int = TABLE_PAGE_ROWS,
+) -> List[bytes]:
+    """Render table as list of images, caching them by table content"""
+    key = hashlib.sha256(json.dumps([t, rows_per_page]).encode()).hexdigest()
+    if key in _pages_cache:
+        _pages_cache.move_to_end(key)
+        return _pages_cache[key]
+
+    pages = [render_table(page) for page in paginate_table(t, rows_per_page)]
+    _pages_cache[key] = pages
+    if len(_pages_cache) > TABLE_CACHE_SIZE:
+        _pages_cache.popitem(last=False)
+
+    return pages
+
+
 def get_first_name(user: User or Channel) -> str:
     """Returns first name of user or channel title"""
     return utils.escape_html(
@@ -282,6 +521,731 @@ BANNED_RIGHTS = {
 }
 
 
+class WriteBehindStore:
+    """JSON file, which is flushed in background only if state changed"""
+
+    def __init__(self, path: str, dump: Callable[[], Any], interval: float = 10.0):
+        self.path = path
+        self._dump = dump
+        self._interval = interval
+        self._dirty = False
+        self._task = None
+
+    def load(self, default: Any = None) -> Any:
+        try:
+            with open(self.path, "r") as f:
+                return json.loads(f.read())
+        except Exception:
+            return default
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flusher())
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.debug(f"Can't flush {self.path}", exc_info=True)
+
+    def _write(self, data: str) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.path)
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+
+        # Reset before dump, so changes made during write mark store dirty again
+        self._dirty = False
+        try:
+            data = json.dumps(self._dump())
+            await asyncio.get_event_loop().run_in_executor(None, self._write, data)
+        except BaseException:
+            self._dirty = True
+            raise
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        await self.flush()
+
+
+class FloodCounter:
+    """Sliding window message counters with idle users eviction"""
+
+    def __init__(
+        self,
+        window: float,
+        threshold: int,
+        max_size: int = 10000,
+        sweep_interval: float = 60.0,
+    ):
+        self.window = window
+        self.threshold = threshold
+        self.max_size = max_size
+        self._sweep_interval = sweep_interval
+        self._next_sweep = 0
+        # (chat_id, user_id) -> timestamps, ordered by last activity
+        self._windows = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def hit(self, chat_id: int, user_id: int) -> bool:
+        """Register message and check if user exceeded threshold"""
+        now = time.time()
+        key = (chat_id, user_id)
+
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = collections.deque(maxlen=self.threshold)
+            if len(self._windows) > self.max_size:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+            while window and now - window[0] > self.window:
+                window.popleft()
+
+        window.append(now)
+
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        return len(window) >= self.threshold
+
+    def sweep(self, now: float = None) -> None:
+        """Evict users, who were inactive for the whole window"""
+        now = now or time.time()
+        self._next_sweep = now + self._sweep_interval
+
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if now - window[-1] <= self.window:
+                break
+
+            del self._windows[key]
+
+    def dump(self) -> dict:
+        result = {}
+        for (chat_id, user_id), window in self._windows.items():
+            result.setdefault(str(chat_id), {})[str(user_id)] = [
+                round(timestamp, 2) for timestamp in window
+            ]
+
+        return result
+
+    def load(self, data: dict) -> None:
+        items = sorted(
+            (
+                (int(chat_id), int(user_id), timestamps)
+                for chat_id, users in data.items()
+                for user_id, timestamps in users.items()
+                if timestamps
+            ),
+            key=lambda item: item[2][-1],
+        )
+
+        for chat_id, user_id, timestamps in items[-self.max_size :]:
+            self._windows[(chat_id, user_id)] = collections.deque(
+                timestamps, maxlen=self.threshold
+            )
+
+        self.sweep()
+
+
+def _pick_thumb(sizes: list) -> Union["PhotoSize", None]:  # noqa: F821
+    """Get smallest size, which is still enough for NSFW check"""
+    sizes = sorted(
+        (size for size in sizes or [] if getattr(size, "w", 0)),
+        key=lambda size: max(size.w, size.h),
+    )
+    return next(
+        (size for size in sizes if max(size.w, size.h) >= NSFW_MIN_SIDE),
+        sizes[-1] if sizes else None,
+    )
+
+
+def _size_bytes(size: "PhotoSize") -> int:  # noqa: F821
+    return getattr(size, "size", None) or max(getattr(size, "sizes", None) or [0])
+
+
+def nsfw_source(message: Message) -> Union[tuple, None]:
+    """
+    Decide from media metadata, what to download for NSFW check
+    :return: (media key, thumb or None to download whole file) or None to skip.
+        Media key is photo or document id, prefixed with p or d, as they may clash
+    """
+    photo = getattr(message, "photo", None)
+    if photo is not None:
+        thumb = _pick_thumb(photo.sizes)
+        if thumb is None or _size_bytes(thumb) > NSFW_MAX_BYTES:
+            return None
+
+        return f"p{photo.id}", thumb
+
+    document = getattr(message, "document", None)
+    if document is None:
+        return None
+
+    if (document.mime_type or "").startswith("image/") and (
+        document.size <= NSFW_MAX_BYTES
+    ):
+        return f"d{document.id}", None
+
+    thumb = _pick_thumb(document.thumbs)
+    if thumb is None or _size_bytes(thumb) > NSFW_MAX_BYTES:
+        return None
+
+    return f"d{document.id}", thumb
+
+
+def perceptual_hash(image: io.BytesIO) -> Union[str, None]:
+    """Get difference hash of image, which survives re-encoding and resizing"""
+    if not PIL_AVAILABLE:
+        return None
+
+    position = image.tell()
+    try:
+        pixels = list(Image.open(image).convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    finally:
+        image.seek(position)
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+
+    return f"{bits:016x}"
+
+
+class VerdictCache:
+    """NSFW verdicts, cached by Telegram media id and by image perceptual hash"""
+
+    def __init__(self, size: int = 5000, ttl: float = 3 * 24 * 60 * 60):
+        self.size = size
+        self.ttl = ttl
+        # level -> {key: (expiration time, verdict)}
+        self._levels = {
+            "media": collections.OrderedDict(),
+            "hash": collections.OrderedDict(),
+        }
+
+    def get(self, level: str, key: Union[str, int, None]) -> Union[str, None]:
+        if key is None:
+            return None
+
+        cache = self._levels[level]
+        key = str(key)
+        if key not in cache:
+            return None
+
+        expires, verdict = cache[key]
+        if expires < time.time():
+            del cache[key]
+            return None
+
+        cache.move_to_end(key)
+        return verdict
+
+    def put(self, level: str, key: Union[str, int, None], verdict: str) -> None:
+        if key is None:
+            return
+
+        cache = self._levels[level]
+        cache[str(key)] = (time.time() + self.ttl, verdict)
+        cache.move_to_end(str(key))
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+
+    def dump(self) -> dict:
+        return {level: list(cache.items()) for level, cache in self._levels.items()}
+
+    def load(self, data: dict) -> None:
+        now = time.time()
+        for level, items in data.items():
+            if level not in self._levels:
+                continue
+
+            for key, (expires, verdict) in items[-self.size :]:
+                # Media keys without p/d prefix come from older snapshots
+                if level == "media" and not key.startswith(("p", "d")):
+                    continue
+
+                if expires > now:
+                    self._levels[level][key] = (expires, verdict)
+
+
+class JoinRateTracker:
+    """Per-chat sliding window of unique joined users"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        # chat_id -> (deque of (timestamp, user_id), set of user_ids)
+        self._chats = {}
+
+    def hit(self, chat_id: int, user_id: int) -> int:
+        """Register join and get amount of unique users joined within window"""
+        now = time.time()
+
+        if chat_id not in self._chats:
+            self._chats[chat_id] = (collections.deque(), set())
+
+        joins, users = self._chats[chat_id]
+
+        while joins and now - joins[0][0] > self.window:
+            users.discard(joins.popleft()[1])
+
+        if user_id not in users:
+            users.add(user_id)
+            joins.append((now, user_id))
+
+        return len(users)
+
+    def reset(self, chat_id: int) -> None:
+        self._chats.pop(chat_id, None)
+
+
+def _explicit_pattern() -> "re.Pattern":
+    """Compile AntiExplicit profanity pattern"""
+    P = "пПnPp"
+    I = "иИiI1uІИ́Їіи́ї"  # noqa: E741
+    E = "еЕeEЕ́е́"
+    D = "дДdD"
+    Z = "зЗ3zZ3"
+    M = "мМmM"
+    U = "уУyYuUУ́у́"
+    O = "оОoO0О́о́"  # noqa: E741
+    L = "лЛlL1"
+    A = "аАaAА́а́@"
+    N = "нНhH"
+    G = "гГgG"
+    K = "кКkK"
+    R = "рРpPrR"
+    H = "хХxXhH"
+    YI = "йЙyуУY"
+    YA = "яЯЯ́я́"
+    YO = "ёЁ"
+    YU = "юЮЮ́ю́"
+    B = "бБ6bB"
+    T = "тТtT1"
+    HS = "ъЪ"
+    SS = "ьЬ"
+    Y = "ыЫ"
+
+    return re.compile(
+        rf"""\b[0-9]*(\w*[{P}][{I}{E}][{Z}][{D}]\w*|(?:[^{I}{U}\s]+|{N}{I})?(?<!стра)[{H}][{U}][{YI}{E}{YA}{YO}{I}{L}{YU}](?!иг)\w*|\w*[{B}][{L}](?:[{YA}]+[{D}{T}]?|[{I}]+[{D}{T}]+|[{I}]+[{A}]+)(?!х)\w*|(?:\w*[{YI}{U}{E}{A}{O}{HS}{SS}{Y}{YA}][{E}{YO}{YA}{I}][{B}{P}](?!ы\b|ол)\w*|[{E}{YO}][{B}]\w*|[{I}][{B}][{A}]\w+|[{YI}][{O}][{B}{P}]\w*)|\w*(?:[{P}][{I}{E}][{D}][{A}{O}{E}]?[{R}](?!о)\w*|[{P}][{E}][{D}][{E}{I}]?[{G}{K}])|\w*[{Z}][{A}{O}][{L}][{U}][{P}]\w*|\w*[{M}][{A}][{N}][{D}][{A}{O}]\w*|\w*[{G}][{O}{A}][{N}][{D}][{O}][{N}]\w*)"""
+    )
+
+
+EXPLICIT_RE = _explicit_pattern()
+
+
+class ExplicitMatcher:
+    """AntiExplicit matcher with LRU cache of verdicts"""
+
+    def __init__(self, exclusions: List[str], cache_size: int = 4096):
+        self.exclusions = list(exclusions)
+        self._exclusions_re = (
+            re.compile("|".join(map(re.escape, self.exclusions)))
+            if self.exclusions
+            else None
+        )
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+
+    def _match(self, text: str) -> bool:
+        return any(
+            self._exclusions_re is None
+            or not self._exclusions_re.search(match.group(1))
+            for match in EXPLICIT_RE.finditer(text)
+        )
+
+    def check(self, text: str) -> bool:
+        """Check if text contains explicit words, which are not excluded"""
+        text = " ".join(text.split())
+        key = hash(text)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        verdict = self._match(text)
+        self._cache[key] = verdict
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+        return verdict
+
+
+def apply_patch(state: dict, patch: dict) -> None:
+    """
+    Apply single delta patch to state
+    :param patch: {"op": "set" | "delete" | "append", "path": [...], "value": ...}
+    """
+    *path, key = patch["path"]
+    for part in path:
+        state = state.setdefault(part, {})
+
+    if patch["op"] == "set":
+        state[key] = patch["value"]
+    elif patch["op"] == "delete":
+        state.pop(key, None)
+    elif patch["op"] == "append":
+        state.setdefault(key, []).append(patch["value"])
+    else:
+        raise ValueError(f"Unknown patch operation {patch['op']}")
+
+
+def apply_patches(state: dict, patches: list) -> dict:
+    """
+    Apply delta patches without touching original state
+    Containers along patched paths are copied, the rest is shared
+    :return: New state
+    """
+    state = dict(state)
+    copied = {id(state)}
+
+    def own(node: Any, key: Any, default: Any) -> Any:
+        child = node.get(key, default)
+        if id(child) not in copied:
+            child = node[key] = child.copy()
+            copied.add(id(child))
+
+        return child
+
+    for patch in patches:
+        *path, key = patch["path"]
+        node = state
+        for part in path:
+            node = own(node, part, {})
+
+        if patch["op"] == "append":
+            own(node, key, [])
+
+        apply_patch(node, {**patch, "path": [key]})
+
+    return state
+
+
+class LatencyStats:
+    """In-memory call counters and latency histograms"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.since = time.time()
+        # name -> [calls, triggers, total time, histogram]
+        self._stats = {}
+
+    def record(self, name: str, latency: float, triggered: bool = False) -> None:
+        stat = self._stats.get(name)
+        if stat is None:
+            stat = self._stats[name] = [0, 0, 0.0, [0] * len(LATENCY_BUCKETS)]
+
+        stat[0] += 1
+        stat[1] += bool(triggered)
+        stat[2] += latency
+        stat[3][
+            min(bisect.bisect_left(LATENCY_BUCKETS, latency), len(LATENCY_BUCKETS) - 1)
+        ] += 1
+
+    @staticmethod
+    def _percentile(histogram: list, calls: int, q: float) -> float:
+        seen = 0
+        for bucket, count in zip(LATENCY_BUCKETS, histogram):
+            seen += count
+            if seen >= q * calls:
+                return bucket
+
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self) -> list:
+        """
+        Stats of every measured function, most time-consuming first
+        :return: [(name, calls, triggers, total, p50, p95, p99), ...]
+        """
+        return sorted(
+            (
+                (
+                    name,
+                    calls,
+                    triggers,
+                    total,
+                    *(
+                        self._percentile(histogram, calls, q)
+                        for q in (0.5, 0.95, 0.99)
+                    ),
+                )
+                for name, (calls, triggers, total, histogram) in self._stats.items()
+            ),
+            key=lambda row: row[3],
+            reverse=True,
+        )
+
+
+latency_stats = LatencyStats()
+
+
+def measured(name: str = None) -> Callable:
+    """
+    Record latency of coroutine function in latency_stats
+    Truthy result is counted as trigger
+    """
+
+    def decorator(func: Callable) -> Callable:
+        key = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            finally:
+                latency_stats.record(key, time.perf_counter() - start, result)
+
+        return wrapped
+
+    return decorator
+
+
+class UserWarns:
+    """Warns of single user: reasons in order and per-reason counter"""
+
+    __slots__ = ("reasons", "counts")
+
+    def __init__(self, reasons: list = None):
+        self.reasons = []
+        self.counts = collections.Counter()
+        for reason in reasons or []:
+            self.add(reason)
+
+    def __len__(self) -> int:
+        return len(self.reasons)
+
+    def add(self, reason: str) -> None:
+        self.reasons += [reason]
+        self.counts[reason] += 1
+
+    def pop(self) -> None:
+        """Forgive last warn"""
+        if not self.reasons:
+            return
+
+        reason = self.reasons.pop()
+        self.counts[reason] -= 1
+        if not self.counts[reason]:
+            del self.counts[reason]
+
+    def grouped(self) -> list:
+        """
+        Unique reasons in order of first occurrence
+        :return: [(reason, count), ...]
+        """
+        return list(self.counts.items())
+
+
+class TokenBucket:
+    """Rate limiter, which slows down after FloodWait and recovers on success"""
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.blocked_until = 0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if now < self.blocked_until or self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+    def ready_in(self, now: float) -> float:
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+
+    def flood(self, seconds: int) -> None:
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.rate = max(self.rate / 2, self.base_rate / 16)
+        self.tokens = 0
+        self._updated = now
+
+    def success(self) -> None:
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 16)
+
+
+class RPCScheduler:
+    """
+    Global queue of outgoing Telegram calls. Calls are executed by priority,
+    each method is limited by its own token bucket. If queue overflows, the
+    least important calls are shed
+    """
+
+    def __init__(self, size: int = RPC_QUEUE_SIZE, workers: int = RPC_WORKERS):
+        self._size = size
+        self._workers = workers
+        self._queues = [collections.deque() for _ in range(RPC_LOW + 1)]
+        self._buckets = {}
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self.shed = 0
+        self.flood_waits = 0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._worker()) for _ in range(self._workers)
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        self._tasks = []
+
+        for queue in self._queues:
+            while queue:
+                future = queue.popleft()[2]
+                if not future.done():
+                    future.cancel()
+
+    def _bucket(self, method: str) -> TokenBucket:
+        if method not in self._buckets:
+            rate, burst, _ = RPC_METHODS.get(method, RPC_DEFAULT)
+            self._buckets[method] = TokenBucket(rate, burst)
+
+        return self._buckets[method]
+
+    def _shed(self, priority: int) -> bool:
+        """Make room for call with given priority, dropping less important one"""
+        if priority == RPC_CRITICAL or sum(map(len, self._queues)) < self._size:
+            return True
+
+        for queue in reversed(self._queues[priority + 1 :]):
+            if queue:
+                future = queue.pop()[2]
+                if not future.done():
+                    future.set_result(None)
+
+                self.shed += 1
+                return True
+
+        return False
+
+    async def call(
+        self,
+        method: str,
+        factory: Callable[[], Awaitable],
+        priority: int = None,
+    ) -> Any:
+        """
+        Schedule call and wait for its result
+        :param method: Rate limit group, see RPC_METHODS
+        :param factory: Function, which returns awaitable to execute
+        :param priority: Overrides default priority of method
+        :return: Result of call or None, if it was shed
+        """
+        if priority is None:
+            priority = RPC_METHODS.get(method, RPC_DEFAULT)[2]
+
+        if not self._tasks:
+            return await factory()
+
+        if not self._shed(priority):
+            self.shed += 1
+            return None
+
+        future = asyncio.get_event_loop().create_future()
+        self._queues[priority].append((method, factory, future, priority))
+        self._wakeup.set()
+        return await future
+
+    def _next(self) -> tuple:
+        now = time.monotonic()
+        delay = None
+        for queue in self._queues:
+            for i, item in enumerate(queue):
+                bucket = self._bucket(item[0])
+                if bucket.take(now):
+                    del queue[i]
+                    return item, None
+
+                ready_in = bucket.ready_in(now)
+                delay = ready_in if delay is None else min(delay, ready_in)
+
+        return None, delay
+
+    async def _worker(self) -> None:
+        while True:
+            item, delay = self._next()
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            method, factory, future, priority = item
+            if future.done():
+                continue
+
+            try:
+                result = await factory()
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                self._bucket(method).flood(e.seconds)
+                if e.seconds <= FLOOD_WAIT_MAX:
+                    self._queues[priority].appendleft(item)
+                elif not future.done():
+                    future.set_exception(e)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self._bucket(method).success()
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queued": [len(queue) for queue in self._queues],
+            "shed": self.shed,
+            "flood_waits": self.flood_waits,
+            "blocked": {
+                method: round(bucket.blocked_until - time.monotonic())
+                for method, bucket in self._buckets.items()
+                if bucket.blocked_until > time.monotonic()
+            },
+        }
+
+
 class HikariChatAPI:
     def __init__(self):
         pass
@@ -299,31 +1263,104 @@ class HikariChatAPI:
         self.module = module
         self._bot = "@hikka_userbot"
 
-        self._queue = []
+        self._outbox = asyncio.Queue(OUTBOX_SIZE)
+        self._session = None
+        self._http_semaphore = asyncio.Semaphore(HTTP_CONCURRENCY)
+        self._ws = None
+        self._ws_ready = asyncio.Event()
+        self.dropped = 0
+        self.flush_latency = 0.0
         self.feds = {}
         self.chats = {}
+        self._version = None
+        self._dispatch = {}
+        self._chat_feds = {}
+        self._fdef = {}
+        self._notes = {}
+        self._note_payloads = {}
+        self._warns = {}
         self.variables = {}
+        self.explicit = ExplicitMatcher([])
         self.init_done = asyncio.Event()
         self._show_warning = True
         self._connected = False
         self._inited = True
 
+        self._snapshot = WriteBehindStore(
+            "hikarichat_snapshot.json",
+            lambda: {
+                "chats": self.chats,
+                "feds": self.feds,
+                "variables": self.variables,
+                "version": self._version,
+            },
+        )
+        warm = self._load_snapshot()
+        self._snapshot.start()
+
         if not self._db.get("HikkaDL", "token"):
             await self._get_token()
 
         self._task = asyncio.ensure_future(self._connect())
-        await self.init_done.wait()
+        self._sender_task = asyncio.ensure_future(self._sender())
+
+        if not warm:
+            await self.init_done.wait()
+
+    def _load_snapshot(self) -> bool:
+        """Restore last known state, so protections work before connection is up"""
+        snapshot = self._snapshot.load({})
+        if not snapshot.get("variables"):
+            return False
+
+        try:
+            self.update_variables(snapshot["variables"])
+            self.chats = snapshot["chats"]
+            self.feds = snapshot["feds"]
+            self._version = snapshot.get("version")
+            self.rebuild_dispatch()
+            self.rebuild_feds_index()
+            self.rebuild_warns()
+        except Exception:
+            logger.debug("Can't restore HikariChat snapshot", exc_info=True)
+            return False
+
+        logger.debug("HikariChat started from snapshot")
+        return True
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        self._sender_task.cancel()
+        await self._snapshot.stop()
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get long-lived HTTP session with keep-alive connections pool"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=HTTP_LIMIT_PER_HOST,
+                    keepalive_timeout=60,
+                ),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+
+        return self._session
 
     async def _wss(self) -> None:
         async with websockets.connect(
-            f"wss://hikarichat.hikariatama.ru/ws/{self._db.get('HikkaDL', 'token')}"
+            self._db.get("HikariChat", "ws_url", "wss://hikarichat.hikariatama.ru/ws")
+            + f"/{self._db.get('HikkaDL', 'token')}"
         ) as wss:
             init = json.loads(await wss.recv())
 
             logger.debug(f"HikariChat connection debug info {init}")
 
             if init["event"] == "startup":
-                self.variables = init["variables"]
+                self.update_variables(init["variables"])
             elif init["event"] == "license_violation":
                 self.init_done.set()
                 await wss.close()
@@ -336,22 +1373,158 @@ class HikariChatAPI:
             self._connected = True
             self._inited = True
 
-            while True:
-                ans = json.loads(await wss.recv())
+            self._ws = wss
+            self._ws_ready.set()
 
-                if ans["event"] == "update_info":
-                    self.chats = ans["chats"]
-                    self.feds = ans["feds"]
+            try:
+                await self._receiver(wss)
+            finally:
+                self._ws_ready.clear()
+                self._ws = None
+
+    async def _receiver(self, wss: "websockets.WebSocketClientProtocol") -> None:
+        while True:
+            ans = json.loads(await wss.recv())
+            start = time.perf_counter()
+
+            if ans["event"] == "update_info":
+                self.chats = ans["chats"]
+                self.feds = ans["feds"]
+                self._version = ans.get("version")
+                self.rebuild_dispatch()
+                self.rebuild_feds_index()
+                self.rebuild_warns()
+                self._snapshot.mark_dirty()
+
+                await wss.send(
+                    json.dumps(
+                        {
+                            "ok": True,
+                            "queue": [],
+                            "version": self._version,
+                            "delta": True,
+                        }
+                    )
+                )
+
+            if ans["event"] == "update_delta":
+                ok = self.apply_delta(ans)
+                await wss.send(
+                    json.dumps({"ok": ok, "version": self._version, "resync": not ok})
+                )
 
-                    await wss.send(json.dumps({"ok": True, "queue": self._queue}))
-                    self._queue = []
+            if ans["event"] == "queue_status":
+                await self._client.edit_message(
+                    ans["chat_id"],
+                    ans["message_id"],
+                    ans["text"],
+                )
+
+            latency_stats.record(
+                f"ws_recv:{ans['event']}",
+                time.perf_counter() - start,
+            )
 
-                if ans["event"] == "queue_status":
-                    await self._client.edit_message(
-                        ans["chat_id"],
-                        ans["message_id"],
-                        ans["text"],
+    def apply_delta(self, delta: dict) -> bool:
+        """
+        Apply incremental update to chats and feds
+        :return: False if delta doesn't fit current version and snapshot is needed
+        """
+        if self._version is None or delta["base"] != self._version:
+            logger.debug(
+                f"HikariChat delta {delta['base']} doesn't fit {self._version}"
+            )
+            return False
+
+        try:
+            state = apply_patches(
+                {"chats": self.chats, "feds": self.feds},
+                delta["patches"],
+            )
+        except Exception:
+            logger.debug("Can't apply HikariChat delta", exc_info=True)
+            self._version = None
+            return False
+
+        self.chats, self.feds = state["chats"], state["feds"]
+        self._version = delta["version"]
+
+        for patch in delta["patches"]:
+            if patch["path"][0] == "chats":
+                if len(patch["path"]) > 1:
+                    self.rebuild_dispatch(patch["path"][1])
+                else:
+                    self.rebuild_dispatch()
+
+        feds_patches = [
+            patch["path"] for patch in delta["patches"] if patch["path"][0] == "feds"
+        ]
+
+        if any(len(path) < 3 or path[2] != "warns" for path in feds_patches):
+            self.rebuild_feds_index()
+
+        for path in feds_patches:
+            if len(path) > 3 and path[2] == "warns":
+                self.rebuild_warns(path[1], path[3])
+            else:
+                self.rebuild_warns(path[1] if len(path) > 1 else None)
+
+        self._snapshot.mark_dirty()
+        return True
+
+    async def _sender(self) -> None:
+        """Sends queued requests in batches as soon as connection is up"""
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._outbox.get()]
+            deadline = loop.time() + OUTBOX_WINDOW
+            while len(batch) < OUTBOX_BATCH and loop.time() < deadline:
+                try:
+                    batch += [
+                        await asyncio.wait_for(
+                            self._outbox.get(),
+                            deadline - loop.time(),
+                        )
+                    ]
+                except asyncio.TimeoutError:
+                    break
+
+            # Batches, which fail for other reason than closed connection, are
+            # split in halves until the faulty request is isolated and dropped
+            pending = [batch]
+            while pending:
+                batch = pending.pop()
+                await self._ws_ready.wait()
+                start = time.perf_counter()
+                try:
+                    await self._ws.send(
+                        json.dumps(
+                            {"ok": True, "queue": [payload for _, payload in batch]}
+                        )
                     )
+                except websockets.ConnectionClosed:
+                    logger.debug("HikariChat connection closed", exc_info=True)
+                    self._ws_ready.clear()
+                    pending += [batch]
+                except Exception:
+                    logger.debug("Can't send HikariChat queue", exc_info=True)
+                    if len(batch) > 1:
+                        pending += [batch[len(batch) // 2 :], batch[: len(batch) // 2]]
+                    else:
+                        self.dropped += 1
+                        logger.warning(
+                            f"HikariChat rejected {batch[0][1].get('action')}, dropped"
+                        )
+                else:
+                    latency_stats.record("ws_send", time.perf_counter() - start)
+                    self.flush_latency = time.time() - batch[0][0]
+
+    def queue_stats(self) -> dict:
+        return {
+            "depth": self._outbox.qsize(),
+            "dropped": self.dropped,
+            "flush_latency": self.flush_latency,
+        }
 
     async def _connect(self) -> None:
         while True:
@@ -383,66 +1556,849 @@ class HikariChatAPI:
                 },
             }
 
-        self._queue += [payload]
+        try:
+            self._outbox.put_nowait((time.time(), payload))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"HikariChat queue is full, dropped {payload['action']}")
+
+    def update_variables(self, variables: dict) -> None:
+        """Set server-side variables and recompile dependent matchers"""
+        self.variables = variables
+        self._snapshot.mark_dirty()
+
+        exclusions = variables.get("censor_exclusions", [])
+        if list(exclusions) != self.explicit.exclusions:
+            self.explicit = ExplicitMatcher(exclusions)
+
+    def _build_plan(self, chat_id: Union[str, int]) -> tuple:
+        """Get protections, enabled in chat by current account, in dispatch order"""
+        info = self.chats.get(str(chat_id)) or {}
+        return tuple(
+            protection
+            for protection in ["antiservice"] + list(DISPATCH_ORDER)
+            if protection in info and str(info[protection][1]) == str(self._me)
+        )
+
+    def rebuild_dispatch(self, chat_id: Union[str, int, None] = None) -> None:
+        """Rebuild dispatch plans for all chats or for the specified one"""
+        if chat_id is not None:
+            plan = self._build_plan(chat_id)
+            if plan:
+                self._dispatch[int(chat_id)] = plan
+            else:
+                self._dispatch.pop(int(chat_id), None)
+            return
+
+        self._dispatch = {}
+        for chat in self.chats:
+            self.rebuild_dispatch(chat)
+
+    def rebuild_feds_index(self) -> None:
+        """Rebuild chat -> federation index and federation defense lists"""
+        self._chat_feds = {
+            int(chat): federation
+            for federation, info in self.feds.items()
+            for chat in info["chats"]
+            if str(chat).lstrip("-").isdigit()
+        }
+        self._fdef = {
+            federation: frozenset(
+                int(user)
+                for user in info.get("fdef", [])
+                if str(user).lstrip("-").isdigit()
+            )
+            for federation, info in self.feds.items()
+        }
+
+        notes = {}
+        for federation, info in self.feds.items():
+            own = [
+                note
+                for note, note_info in info.get("notes", {}).items()
+                if str(note_info["creator"]) == str(self._me)
+            ]
+            if not own:
+                continue
+
+            matcher = self._notes.get(federation)
+            notes[federation] = (
+                matcher
+                if matcher is not None and matcher.notes == tuple(own)
+                else NotesMatcher(own)
+            )
+
+        self._notes = notes
+
+        texts = {
+            note_info["text"]
+            for info in self.feds.values()
+            for note_info in info.get("notes", {}).values()
+        }
+        self._note_payloads = {
+            text: payload
+            for text, payload in self._note_payloads.items()
+            if text in texts
+        }
+
+    def rebuild_warns(self, federation: str = None, user: str = None) -> None:
+        """Rebuild warns index of all federations, single federation or single user"""
+        if federation is None:
+            self._warns = {}
+            for federation in self.feds:
+                self.rebuild_warns(federation)
+            return
+
+        warns = self.feds.get(federation, {}).get("warns", {})
+
+        if user is None:
+            self._warns[federation] = {
+                str(user): UserWarns(reasons)
+                for user, reasons in warns.items()
+                if reasons
+            }
+            return
+
+        index = self._warns.setdefault(federation, {})
+        if warns.get(str(user)):
+            index[str(user)] = UserWarns(warns[str(user)])
+        else:
+            index.pop(str(user), None)
+
+    def warns(self, federation: str, user: Union[str, int] = None) -> Any:
+        """
+        Get indexed warns
+        :return: {user: UserWarns} of federation or UserWarns of single user
+        """
+        index = self._warns.get(federation, {})
+        return index if user is None else index.get(str(user), UserWarns())
+
+    def add_warn(
+        self,
+        federation: str,
+        user: Union[str, int],
+        reason: str,
+    ) -> UserWarns:
+        """Account warn locally until server confirms it"""
+        index = self._warns.setdefault(federation, {})
+        warns = index.setdefault(str(user), UserWarns())
+        warns.add(reason)
+        return warns
+
+    def forgive_warn(self, federation: str, user: Union[str, int]) -> None:
+        warns = self._warns.get(federation, {}).get(str(user))
+        if warns is None:
+            return
+
+        warns.pop()
+        if not warns:
+            del self._warns[federation][str(user)]
+
+    def clear_warns(self, federation: str, user: Union[str, int] = None) -> None:
+        if user is None:
+            self._warns[federation] = {}
+        else:
+            self._warns.get(federation, {}).pop(str(user), None)
+
+    def note_payload(self, federation: str, note: str) -> tuple:
+        """Get compiled note payload, rendering it only once per note content"""
+        text = self.feds[federation]["notes"][note]["text"]
+        if text not in self._note_payloads:
+            self._note_payloads[text] = render_note(text)
+
+        return self._note_payloads[text]
+
+    def forget_note(self, federation: str, note: str) -> None:
+        """Drop compiled payload of note, which is going to be changed"""
+        info = self.feds.get(federation, {}).get("notes", {}).get(note)
+        if info:
+            self._note_payloads.pop(info["text"], None)
+
+    def find_notes(self, federation: str, text: str) -> List[str]:
+        """Find triggers of own federation notes in text"""
+        matcher = self._notes.get(federation)
+        return matcher.find(text) if matcher is not None else []
+
+    def dispatch_plan(self, chat_id: int) -> tuple:
+        """Get precompiled protections list for chat"""
+        return self._dispatch.get(chat_id, ())
+
+    def in_federation(self, chat_id: int) -> bool:
+        return chat_id in self._chat_feds
+
+    def find_fed(self, chat_id: Union[str, int]) -> Union[str, None]:
+        """Get shortname of federation, which chat belongs to"""
+        try:
+            return self._chat_feds.get(int(chat_id))
+        except (TypeError, ValueError):
+            return None
+
+    def fdef(self, federation: str) -> frozenset:
+        """Get ids of users, protected in federation"""
+        return self._fdef.get(federation, frozenset())
+
+    def should_protect(self, chat_id: Union[str, int], protection: str) -> bool:
+        return protection in self._dispatch.get(int(chat_id), ())
+
+    async def nsfw(self, photo: bytes) -> Union[str, None]:
+        """
+        Check photo for NSFW content
+        :return: Verdict or None if check failed
+        """
+        if not self._db.get("HikkaDL", "token"):
+            logger.warning("Token is not sent, NSFW check forbidden")
+            return None
+
+        async with self._http_semaphore:
+            async with self._get_session().request(
+                "POST",
+                "https://hikarichat.hikariatama.ru/check_nsfw",
+                headers={"Authorization": f"Bearer {self._db.get('HikkaDL', 'token')}"},
+                data={"file": photo},
+            ) as resp:
+                r = await resp.text()
+
+                try:
+                    r = json.loads(r)
+                except Exception:
+                    logger.exception("Failed to check NSFW")
+                    return None
+
+                if "error" in r and "Rate limit" in r["error"]:
+                    logger.warning("NSFW checker ratelimit exceeded")
+                    return None
+
+                if "success" not in r:
+                    logger.error(f"API error {json.dumps(r, indent=4)}")
+                    return None
+
+                return r["verdict"]
+
+    async def _get_token(self) -> None:
+        async with self._client.conversation(self._bot) as conv:
+            m = await conv.send_message("/token")
+            r = await conv.get_response()
+            token = r.raw_text
+            await m.delete()
+            await r.delete()
+
+            if not token.startswith("kirito_") and not token.startswith("asuna_"):
+                raise LoadError("Can't get token")
+
+            self._db.set("HikkaDL", "token", token)
+
+        await self._client.delete_dialog(self._bot)
+
+
+api = HikariChatAPI()
+
+
+class EntityCache:
+    """Bounded LRU cache of resolved users and chats with TTL"""
+
+    def __init__(self, size: int = 4096, ttl: float = 600.0):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # marked peer id -> (expiration time, entity)
+        self._entities = collections.OrderedDict()
+        # unmarked chat or channel id -> marked peer id
+        self._chats = {}
+
+    @staticmethod
+    def _is_id(peer: Union[int, str]) -> bool:
+        return isinstance(peer, int) or (
+            isinstance(peer, str) and peer.lstrip("-").isdigit()
+        )
+
+    def _key(self, peer: Union[int, str], chat: bool = False) -> Union[int, None]:
+        """
+        Get marked peer id of cached entity
+        :param chat: Positive peer is unmarked chat or channel id, not user id
+        """
+        if not self._is_id(peer):
+            return None
+
+        peer = int(peer)
+        return self._chats.get(peer) if chat and peer > 0 else peer
+
+    def _drop(self, key: int) -> None:
+        _, entity = self._entities.pop(key)
+        if not isinstance(entity, User) and self._chats.get(entity.id) == key:
+            del self._chats[entity.id]
+
+    def put(self, entity: Union[User, Chat, Channel, None]) -> None:
+        if not isinstance(entity, (User, Chat, Channel)) or getattr(
+            entity, "min", False
+        ):
+            return
+
+        key = telethon.utils.get_peer_id(entity)
+        self._entities[key] = (time.time() + self.ttl, entity)
+        self._entities.move_to_end(key)
+        if not isinstance(entity, User):
+            self._chats[entity.id] = key
+
+        if len(self._entities) > self.size:
+            self._drop(next(iter(self._entities)))
+
+    def warm(self, event: Any) -> None:
+        """Store entities, which are already attached to event"""
+        for entity in getattr(event, "_entities", {}).values():
+            self.put(entity)
+
+        self.put(getattr(event, "_sender", None))
+        self.put(getattr(event, "_chat", None))
+
+    def get(
+        self,
+        peer: Union[int, str],
+        chat: bool = False,
+    ) -> Union[User, Chat, Channel, None]:
+        """
+        :param peer: Marked peer id, or unmarked chat id if chat is set
+        """
+        key = self._key(peer, chat)
+        if key not in self._entities:
+            return None
+
+        expires, entity = self._entities[key]
+        if expires < time.time():
+            self._drop(key)
+            return None
+
+        self._entities.move_to_end(key)
+        return entity
+
+    async def resolve(
+        self,
+        client: "TelegramClient",  # noqa: F821
+        peer: Union[int, str, User, Chat, Channel],
+        chat: bool = False,
+    ) -> Union[User, Chat, Channel]:
+        """Get entity from cache or fetch it with client"""
+        if isinstance(peer, (User, Chat, Channel)):
+            return peer
+
+        entity = self.get(peer, chat)
+        if entity is not None:
+            self.hits += 1
+            return entity
+
+        self.misses += 1
+        entity = await client.get_entity(peer)
+        self.put(entity)
+        return entity
+
+    async def resolve_many(
+        self,
+        client: "TelegramClient",  # noqa: F821
+        peers: list,
+        call: Callable[[Callable[[], Awaitable]], Awaitable] = None,
+        gone: set = None,
+        chats: bool = False,
+    ) -> list:
+        """
+        Resolve many peers at once. Missing users, chats and channels are fetched
+        in batches of RESOLVE_BATCH, usernames are resolved one by one. If batch
+        fails, its peers are resolved one by one too
+        :param call: Runs request factory, e.g. through RPC scheduler
+        :param gone: Filled with indexes of peers, which surely don't exist
+        :param chats: Positive peers are unmarked chat ids, not user ids
+        :return: Entities in the same order as peers, None if peer can't be resolved
+        """
+        if call is None:
+            call = lambda factory: factory()  # noqa: E731
+
+        if gone is None:
+            gone = set()
+
+        entities = [None] * len(peers)
+        # request -> [(index, id, input entity)]
+        pending = collections.defaultdict(list)
+        single = []
+
+        for i, peer in enumerate(peers):
+            if isinstance(peer, (User, Chat, Channel)):
+                entities[i] = peer
+                continue
+
+            entity = self.get(peer, chats)
+            if entity is not None:
+                self.hits += 1
+                entities[i] = entity
+                continue
+
+            self.misses += 1
+            if not self._is_id(peer):
+                single += [i]
+                continue
+
+            try:
+                input_peer = await client.get_input_entity(int(peer))
+            except ValueError:
+                gone.add(i)
+                continue
+            except Exception:
+                logger.debug(f"Can't get input entity of {peer}", exc_info=True)
+                continue
+
+            if isinstance(input_peer, InputPeerUser):
+                pending[GetUsersRequest] += [
+                    (
+                        i,
+                        input_peer.user_id,
+                        InputUser(input_peer.user_id, input_peer.access_hash),
+                    )
+                ]
+            elif isinstance(input_peer, InputPeerChannel):
+                pending[GetChannelsRequest] += [
+                    (
+                        i,
+                        input_peer.channel_id,
+                        InputChannel(input_peer.channel_id, input_peer.access_hash),
+                    )
+                ]
+            elif isinstance(input_peer, InputPeerChat):
+                pending[GetChatsRequest] += [
+                    (i, input_peer.chat_id, input_peer.chat_id)
+                ]
+            else:
+                single += [i]
+
+        async def fetch_one(i: int) -> None:
+            peer = int(peers[i]) if self._is_id(peers[i]) else peers[i]
+            try:
+                entity = await call(lambda: client.get_entity(peer))
+            except ValueError:
+                gone.add(i)
+                return
+            except Exception:
+                logger.debug(f"Can't resolve {peer}", exc_info=True)
+                return
+
+            entities[i] = entity
+            self.put(entity)
+
+        async def fetch(request: type, batch: list) -> None:
+            try:
+                result = await call(
+                    lambda: client(request([item for _, _, item in batch]))
+                )
+            except Exception:
+                logger.debug(f"Can't fetch {request.__name__} batch", exc_info=True)
+                result = None
+
+            if result is None:
+                await asyncio.gather(*[fetch_one(i) for i, _, _ in batch])
+                return
+
+            fetched = {
+                entity.id: entity
+                for entity in (result if isinstance(result, list) else result.chats)
+                if isinstance(entity, (User, Chat, Channel))
+            }
+
+            for i, entity_id, _ in batch:
+                entities[i] = fetched.get(entity_id)
+                if entities[i] is None:
+                    gone.add(i)
+                else:
+                    self.put(entities[i])
+
+        await asyncio.gather(
+            *[
+                fetch(request, batch)
+                for request, items in pending.items()
+                for batch in chunks(items, RESOLVE_BATCH)
+            ],
+            *[fetch_one(i) for i in single],
+        )
+
+        return entities
+
+    def invalidate(self, peer_id: int, chat: bool = False) -> None:
+        key = self._key(peer_id, chat)
+        if key in self._entities:
+            self._drop(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entities),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+entity_cache = EntityCache()
+
+
+ADMIN_PARTICIPANTS = (
+    ChannelParticipantAdmin,
+    ChannelParticipantCreator,
+    ChatParticipantAdmin,
+    ChatParticipantCreator,
+)
+
+
+class AdminRoster:
+    """Per-chat cache of administrators, fetched with admins filter"""
+
+    def __init__(
+        self,
+        client: "TelegramClient",  # noqa: F821
+        ttl: float = 300.0,
+        error_ttl: float = 30.0,
+    ):
+        self._client = client
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        # chat_id -> (expiration time, {user_id: participant} or None if failed)
+        self._rosters = {}
+        self._pending = {}
+
+    async def _fetch(self, chat_id: int) -> dict:
+        roster = {}
+        try:
+            # Admins filter is ignored in basic groups, where all members are
+            # returned, so admins are picked by participant type
+            async for user in self._client.iter_participants(
+                chat_id,
+                filter=ChannelParticipantsAdmins,
+            ):
+                participant = getattr(user, "participant", None)
+                if isinstance(participant, ADMIN_PARTICIPANTS):
+                    roster[user.id] = participant
+        except Exception:
+            self._rosters[chat_id] = (time.time() + self._error_ttl, None)
+            raise
+
+        self._rosters[chat_id] = (time.time() + self._ttl, roster)
+        return roster
+
+    async def get(self, chat_id: int) -> dict:
+        """Get admins of chat as {user_id: participant}"""
+        if chat_id in self._rosters and self._rosters[chat_id][0] > time.time():
+            roster = self._rosters[chat_id][1]
+            if roster is None:
+                raise RuntimeError(f"Admins of {chat_id} are unavailable")
+
+            return roster
+
+        if chat_id not in self._pending:
+            self._pending[chat_id] = asyncio.ensure_future(self._fetch(chat_id))
+
+        try:
+            return await asyncio.shield(self._pending[chat_id])
+        finally:
+            if chat_id in self._pending and self._pending[chat_id].done():
+                del self._pending[chat_id]
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        return user_id in await self.get(chat_id)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._rosters.pop(chat_id, None)
+
+
+NOTE_BUTTON_RE = re.compile(r"\[(.+)\]\((https?://.*)\)")
+HTML_TAG_RE = re.compile(r"<.*?>")
+
+
+def render_note(text: str) -> tuple:
+    """
+    Compile note into ready-to-send payload
+    :return: (text, reply markup or None if note should be sent as plain text)
+    """
+    if not text.startswith("@inline"):
+        return text, None
+
+    text = "\n".join(text.splitlines()[1:])
+    buttons = []
+    lines = []
+    for line in text.splitlines():
+        match = NOTE_BUTTON_RE.match(HTML_TAG_RE.sub("", line).strip())
+        if match:
+            buttons += [[{"text": match.group(1), "url": match.group(2)}]]
+        else:
+            lines += [line]
+
+    if not buttons:
+        return text, None
+
+    return "\n".join(lines), buttons
+
+
+class NotesMatcher:
+    """Aho-Corasick automaton, which finds all note triggers in one pass"""
+
+    def __init__(self, notes: List[str]):
+        self.notes = tuple(notes)
+        # Each state is (transitions, fail state, matched notes indexes)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+
+        for i, note in enumerate(self.notes):
+            state = 0
+            for char in note.lower():
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+
+                state = self._goto[state][char]
+
+            self._out[state].add(i)
+
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+
+                self._out[next_state] |= self._out[self._fail[next_state]]
+
+    def find(self, text: str) -> List[str]:
+        """Get notes, found in text, in the order they were passed"""
+        found = set(self._out[0])
+        state = 0
+
+        for char in text.lower():
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+
+            state = self._goto[state].get(char, 0)
+            found |= self._out[state]
+
+        return [self.notes[i] for i in sorted(found)]
+
+
+class LinkedChannels:
+    """Bidirectional chat <-> linked channel map"""
+
+    def __init__(self):
+        self._channels = {}
+        self._chats = {}
+
+    def link(self, chat_id: int, channel_id: int) -> None:
+        self.unlink(chat_id)
+        if channel_id in self._chats:
+            self.unlink(self._chats[channel_id])
+
+        self._channels[chat_id] = channel_id
+        self._chats[channel_id] = chat_id
+
+    def unlink(self, chat_id: int) -> None:
+        channel_id = self._channels.pop(chat_id, None)
+        if channel_id is not None:
+            del self._chats[channel_id]
+
+    def channel(self, chat_id: int) -> Union[int, None]:
+        """Get channel, linked to chat"""
+        return self._channels.get(chat_id)
+
+    def chat(self, channel_id: int) -> Union[int, None]:
+        """Get chat, which channel is linked to"""
+        return self._chats.get(channel_id)
+
+    def is_channel(self, peer_id: int) -> bool:
+        return peer_id in self._chats
+
+
+class DeletedSweeper:
+    """Streams participant pages into a pool of workers, which kick deleted accounts"""
+
+    def __init__(
+        self,
+        client: "TelegramClient",  # noqa: F821
+        checkpoints: dict,
+        on_checkpoint: Callable[[], None],
+        call: Callable[[str, Callable[[], Awaitable]], Awaitable] = None,
+        workers: int = SWEEP_WORKERS,
+    ):
+        self._client = client
+        # (RPC method group, request factory) -> result, e.g. RPC scheduler,
+        # which also waits out FloodWaits
+        self._call = call or (lambda method, factory: factory())
+        self.checkpoints = checkpoints
+        self._on_checkpoint = on_checkpoint
+        self._workers = workers
+        self.scanned = 0
+        self.kicked = 0
+
+    async def _kick(self, entity: Union[Chat, Channel], user: User) -> bool:
+        try:
+            await self._call(
+                "kick",
+                lambda: self._client.kick_participant(entity, user),
+            )
+            await self._call(
+                "ban",
+                lambda: self._client.edit_permissions(
+                    entity,
+                    user,
+                    until_date=0,
+                    **{right: True for right in BANNED_RIGHTS.keys()},
+                ),
+            )
+        except Exception:
+            logger.debug(f"Can't kick {user.id} from {entity.id}", exc_info=True)
+            return False
+
+        return True
+
+    async def _page(self, entity: Channel, offset: int) -> list:
+        result = await self._call(
+            "resolve",
+            lambda: self._client(
+                GetParticipantsRequest(
+                    entity,
+                    ChannelParticipantsSearch(""),
+                    offset,
+                    SWEEP_PAGE,
+                    hash=0,
+                )
+            ),
+        )
+
+        if result is None:
+            raise RuntimeError("Participants request was shed")
 
-    def should_protect(self, chat_id: Union[str, int], protection: str) -> bool:
-        return (
-            str(chat_id) in self.chats
-            and protection in self.chats[str(chat_id)]
-            and str(self.chats[str(chat_id)][protection][1]) == str(self._me)
-        )
+        users = {user.id: user for user in result.users}
+        return [
+            users[participant.user_id]
+            for participant in result.participants
+            if getattr(participant, "user_id", None) in users
+        ]
 
-    async def nsfw(self, photo: bytes) -> str:
-        if not self._db.get("HikkaDL", "token"):
-            logger.warning("Token is not sent, NSFW check forbidden")
-            return "sfw"
+    async def sweep(self, entity: Union[Chat, Channel]) -> int:
+        """
+        Kick deleted accounts from chat, resuming from checkpoint if there is one
+        :return: Amount of kicked accounts
+        """
+        key = str(entity.id)
+        state = self.checkpoints.setdefault(key, {"offset": 0, "kicked": 0})
+        queue = asyncio.Queue(maxsize=self._workers * 4)
+        pending = collections.deque()
+        queued, failed, seen = set(), set(), set()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.request(
-                "POST",
-                "https://hikarichat.hikariatama.ru/check_nsfw",
-                headers={"Authorization": f"Bearer {self._db.get('HikkaDL', 'token')}"},
-                data={"file": photo},
-            ) as resp:
-                r = await resp.text()
+        # Offset counts only members, which stay in chat. Deleted accounts are
+        # being kicked meanwhile, so this never skips anyone, only rereads a
+        # bit of the previous page, while kicks are still in flight
+        offset = state["offset"]
+
+        def checkpoint() -> None:
+            while pending and not pending[0][1]:
+                pending.popleft()
+
+            state["offset"] = pending[0][0] if pending else offset
+            self._on_checkpoint()
 
+        async def worker() -> None:
+            while True:
+                user, page = await queue.get()
                 try:
-                    r = json.loads(r)
-                except Exception:
-                    logger.exception("Failed to check NSFW")
-                    return "sfw"
+                    if await self._kick(entity, user):
+                        state["kicked"] += 1
+                        self.kicked += 1
+                    else:
+                        failed.add(user.id)
 
-                if "error" in r and "Rate limit" in r["error"]:
-                    logger.warning("NSFW checker ratelimit exceeded")
-                    return "sfw"
+                    page[1] -= 1
+                    checkpoint()
+                finally:
+                    queue.task_done()
 
-                if "success" not in r:
-                    logger.error(f"API error {json.dumps(r, indent=4)}")
-                    return "sfw"
+        workers = [asyncio.ensure_future(worker()) for _ in range(self._workers)]
 
-                return r["verdict"]
+        try:
+            if isinstance(entity, Channel):
+                idle = False
+                while True:
+                    users = await self._page(entity, offset)
+                    if not users:
+                        break
+
+                    page = [offset, 0]
+                    deleted = []
+                    for user in users:
+                        if user.id in seen:
+                            continue
 
-    async def _get_token(self) -> None:
-        async with self._client.conversation(self._bot) as conv:
-            m = await conv.send_message("/token")
-            r = await conv.get_response()
-            token = r.raw_text
-            await m.delete()
-            await r.delete()
+                        if user.deleted and user.id not in failed:
+                            if user.id not in queued:
+                                queued.add(user.id)
+                                deleted += [user]
 
-            if not token.startswith("kirito_") and not token.startswith("asuna_"):
-                raise LoadError("Can't get token")
+                            continue
 
-            self._db.set("HikkaDL", "token", token)
+                        seen.add(user.id)
+                        offset += 1
 
-        await self._client.delete_dialog(self._bot)
+                    self.scanned += offset - page[0] + len(deleted)
 
+                    if offset == page[0] and not deleted:
+                        # Whole page is in flight, wait for kicks to settle
+                        if idle:
+                            break
 
-api = HikariChatAPI()
+                        idle = True
+                        await queue.join()
+                        continue
+
+                    idle = False
+                    page[1] = len(deleted)
+                    if deleted:
+                        pending.append(page)
+
+                    for user in deleted:
+                        await queue.put((user, page))
+
+                    checkpoint()
+            else:
+                page = [0, 0]
+                pending.append(page)
+                async for user in self._client.iter_participants(entity):
+                    self.scanned += 1
+                    if user.deleted:
+                        page[1] += 1
+                        await queue.put((user, page))
 
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
 
-def reverse_dict(d: dict) -> dict:
-    return {val: key for key, val in d.items()}
+        del self.checkpoints[key]
+        self._on_checkpoint()
+        return state["kicked"]
+
+    async def sweep_all(self, entities: list, parallelism: int) -> list:
+        """
+        Sweep several chats concurrently
+        :return: Amount of kicked accounts for each chat, None if sweep failed
+        """
+        semaphore = asyncio.Semaphore(parallelism)
+
+        async def run(entity: Union[Chat, Channel]) -> Union[int, None]:
+            async with semaphore:
+                try:
+                    return await self.sweep(entity)
+                except Exception:
+                    logger.debug(f"Can't sweep {entity.id}", exc_info=True)
+                    return None
+
+        return await asyncio.gather(*[run(entity) for entity in entities])
 
 
 @loader.tds
@@ -562,6 +2518,7 @@ class HikariChatMod(loader.Module):
         "fmute": '💼 <b><a href="{}">{}</a> muted in federation {} {}\nReason: </b><i>{}</i>\n\n{}',
         "funban": '💼 <b><a href="{}">{}</a> unbanned in federation </b><i>{}</i>',
         "funmute": '💼 <b><a href="{}">{}</a> unmuted in federation </b><i>{}</i>',
+        "fed_failed": "⚠️ <b>Failed in {} chat(s)</b>",
         "feds_header": "💼 <b>Federations:</b>\n\n",
         "fed": (
             '💼 <b>Federation "{}" info:</b>\n'
@@ -584,6 +2541,15 @@ class HikariChatMod(loader.Module):
         "fnotes": "💼 <b>Federative notes:</b>\n{}",
         "usage": "ℹ️ <b>Usage: .{} &lt;on/off&gt;</b>",
         "chat_only": "ℹ️ <b>This command is for chats only</b>",
+        "stats": (
+            "📊 <b>HikariChat performance for {} min</b>\n"
+            "<i>calls / triggers / p50 / p95 / p99, ms</i>\n\n{}\n"
+            "<b>Entity cache:</b> <code>{}</code>\n"
+            "<b>API queue:</b> <code>{}</code>\n"
+            "<b>RPC scheduler:</b> <code>{}</code>"
+        ),
+        "stats_empty": "<i>Nothing measured yet</i>\n",
+        "stats_reset": "📊 <b>HikariChat performance stats reset</b>",
         "version": (
             "<b>🌊 {}</b>\n\n"
             "<b>😌 Author: @hikariatama</b>\n"
@@ -596,7 +2562,11 @@ class HikariChatMod(loader.Module):
         "clrallwarns_fed": "👮‍♂️ <b>Forgave all federative warns from federation</b>",
         "cleaning": "🧹 <b>Looking for Deleted accounts...</b>",
         "deleted": "🧹 <b>Removed {} Deleted accounts</b>",
+        "sweep_failed": (
+            "🚫 <b>Can't remove Deleted accounts. Run command again to continue</b>"
+        ),
         "fcleaning": "🧹 <b>Looking for Deleted accounts in federation...</b>",
+        "sweep_progress": "\n<i>Scanned {} members, removed {} Deleted accounts</i>",
         "btn_unban": "🔓 Unban (ADM)",
         "btn_unmute": "🔈 Unmute (ADM)",
         "btn_unwarn": "♻️ De-Warn (ADM)",
@@ -655,10 +2625,22 @@ class HikariChatMod(loader.Module):
             "join_ratelimit",
             15,
             lambda: "How many users per minute need to join until ban starts",
+            "flood_cache_size",
+            10000,
+            lambda: "How many users AntiFlood keeps track of at once",
+            "fed_parallelism",
+            5,
+            lambda: "How many federation chats are processed at once",
         )
 
     async def on_unload(self) -> None:
-        self.api._task.cancel()
+        await self.api.stop()
+        await self._rpc.stop()
+        self._client.remove_event_handler(self._admins_watcher)
+        self._client.remove_event_handler(self._entities_watcher)
+        await self._flood_store.stop()
+        await self._nsfw_store.stop()
+        await self._sweep_store.stop()
 
     def lookup(self, modname: str):
         return next(
@@ -670,19 +2652,150 @@ class HikariChatMod(loader.Module):
             False,
         )
 
-    def save_join_ratelimit(self) -> None:
+    async def rpc(
+        self,
+        method: str,
+        factory: Callable[[], Awaitable],
+        priority: int = None,
+    ) -> Any:
+        """Run Telegram call through global scheduler"""
+        return await self._rpc.call(method, factory, priority)
+
+    async def resolve_entity(
+        self,
+        peer: Union[int, str, User, Chat, Channel],
+        chat: bool = False,
+    ) -> Union[User, Chat, Channel]:
+        """
+        Resolve user or chat, using shared entity cache
+        :param chat: Positive peer is unmarked chat id, e.g. from utils.get_chat_id
+        """
+        return await entity_cache.resolve(self._client, peer, chat)
+
+    async def resolve_entities(
+        self,
+        peers: list,
+        gone: set = None,
+        chats: bool = False,
+    ) -> list:
+        """Resolve many users and chats at once, using shared entity cache"""
+        return await entity_cache.resolve_many(
+            self._client,
+            list(peers),
+            lambda factory: self.rpc("resolve", factory),
+            gone,
+            chats,
+        )
+
+    async def sweep_deleted(
+        self,
+        chats: list,
+        message: Message,
+        header: str,
+    ) -> list:
+        """
+        Kick deleted accounts from chats, showing progress in message
+        :return: Amount of kicked accounts for each chat, None if sweep failed
+        """
+        sweeper = DeletedSweeper(
+            self._client,
+            self._sweep_checkpoints,
+            self._sweep_store.mark_dirty,
+            self.rpc,
+        )
+
+        async def report() -> None:
+            last = None
+            while True:
+                await asyncio.sleep(SWEEP_PROGRESS_INTERVAL)
+                if (sweeper.scanned, sweeper.kicked) == last:
+                    continue
+
+                last = (sweeper.scanned, sweeper.kicked)
+                try:
+                    await utils.answer(
+                        message,
+                        self.strings(header)
+                        + self.strings("sweep_progress").format(*last),
+                    )
+                except Exception:
+                    logger.debug("Can't update sweep progress", exc_info=True)
+
+        reporter = asyncio.ensure_future(report())
+
+        try:
+            return await sweeper.sweep_all(chats, int(self.config["fed_parallelism"]))
+        finally:
+            reporter.cancel()
+            await self._sweep_store.flush()
+
+    async def fed_chats(
+        self,
+        fed: str,
+        check_rights: bool = True,
+        unresolved: set = None,
+    ) -> list:
         """
-        Saves BanNinja ratelimit to fs
+        Resolve federation chats, skipping ones, where we are not admin
+        :param unresolved: Filled with chats, which can't be resolved
         """
-        with open("join_ratelimit.json", "w") as f:
-            f.write(json.dumps(self._join_ratelimit))
+        if unresolved is None:
+            unresolved = set()
+
+        async def resolve(c: Union[str, int]) -> Union[Chat, Channel, None]:
+            try:
+                chat = await self.resolve_entity(
+                    int(c) if str(c).isdigit() else c,
+                    chat=True,
+                )
+            except Exception:
+                logger.debug(f"Can't resolve federation chat {c}", exc_info=True)
+                unresolved.add(c)
+                return None
+
+            if check_rights and not chat.admin_rights and not chat.creator:
+                return None
+
+            return chat
 
-    def save_flood_cache(self) -> None:
+        chats = await asyncio.gather(
+            *[resolve(c) for c in self.api.feds[fed]["chats"]]
+        )
+        return [chat for chat in chats if chat is not None]
+
+    async def fed_execute(
+        self,
+        fed: str,
+        action: Callable[[Union[Chat, Channel]], Awaitable],
+        check_rights: bool = True,
+    ) -> tuple:
         """
-        Saves AntiFlood ratelimit to fs
+        Run action in all federation chats concurrently
+        :return: (chats, where action succeeded, amount of chats, where it failed
+            or which couldn't be resolved)
         """
-        with open("flood_cache.json", "w") as f:
-            f.write(json.dumps(self.flood_cache))
+        semaphore = asyncio.Semaphore(int(self.config["fed_parallelism"]))
+
+        # Actions run their calls through RPC scheduler, which waits out
+        # FloodWaits itself, so any error here is final
+        async def run(chat: Union[Chat, Channel]) -> tuple:
+            try:
+                async with semaphore:
+                    await action(chat)
+            except Exception:
+                logger.debug(f"Federative action failed in {chat.id}", exc_info=True)
+                return None, True
+
+            return chat, False
+
+        unresolved = set()
+        chats = await self.fed_chats(fed, check_rights, unresolved)
+        results = await asyncio.gather(*[run(chat) for chat in chats])
+
+        return (
+            [chat for chat, _ in results if chat is not None],
+            sum(failed for _, failed in results) + len(unresolved),
+        )
 
     async def check_admin(
         self,
@@ -693,6 +2806,12 @@ class HikariChatMod(loader.Module):
         Checks if user is admin in target chat
         """
         try:
+            if isinstance(user_id, (User, int)):
+                return await self._admins.is_admin(
+                    getattr(chat_id, "id", chat_id),
+                    getattr(user_id, "id", user_id),
+                )
+
             return (await self._client.get_permissions(chat_id, user_id)).is_admin
             # We could've ignored only ValueError to check
             # entity for validity, but there are many errors
@@ -704,6 +2823,34 @@ class HikariChatMod(loader.Module):
                 or user_id in self._client.dispatcher.security._sudo
             )
 
+    async def _admins_watcher(
+        self,
+        update: Union[UpdateChannelParticipant, UpdateChatParticipantAdmin],
+    ) -> None:
+        """Drops cached admins of chat, if someone got promoted or demoted"""
+        if isinstance(update, UpdateChatParticipantAdmin):
+            self._admins.invalidate(update.chat_id)
+            return
+
+        if any(
+            isinstance(
+                participant,
+                (ChannelParticipantAdmin, ChannelParticipantCreator),
+            )
+            for participant in (update.prev_participant, update.new_participant)
+        ):
+            self._admins.invalidate(update.channel_id)
+
+    async def _entities_watcher(
+        self,
+        update: Union[UpdateUserName, UpdateChannel],
+    ) -> None:
+        """Drops cached entity of user or channel, which got updated"""
+        if isinstance(update, UpdateUserName):
+            entity_cache.invalidate(update.user_id)
+        else:
+            entity_cache.invalidate(update.channel_id, chat=True)
+
     def chat_command(func) -> FunctionType:
         """
         Decorator to allow execution of certain commands in chat only
@@ -756,7 +2903,7 @@ class HikariChatMod(loader.Module):
 
     async def get_config(self, chat: Union[str, int]) -> tuple:
         info = self.api.chats[str(chat)]
-        cinfo = await self._client.get_entity(int(chat))
+        cinfo = await self.resolve_entity(int(chat), chat=True)
 
         answer_message = (
             f"🌊 <b>HikariChat protection</b>\n<b>{get_full_name(cinfo)}</b>\n\n"
@@ -778,10 +2925,7 @@ class HikariChatMod(loader.Module):
                 }
             ]
 
-        fed = None
-        for federation, info in self.api.feds.items():
-            if str(chat) in info["chats"]:
-                fed = info
+        fed = self.api.feds.get(self.api.find_fed(chat))
 
         answer_message += f"\n💼 <b>{fed['name']}</b>" if fed else ""
 
@@ -808,7 +2952,7 @@ class HikariChatMod(loader.Module):
 
         if protection in self.api.variables["argumented_protects"]:
             if state is None:
-                cinfo = await self._client.get_entity(int(chat))
+                cinfo = await self.resolve_entity(int(chat), chat=True)
                 markup = chunks(
                     [
                         {
@@ -878,6 +3022,8 @@ class HikariChatMod(loader.Module):
                 else:
                     del self.api.chats[str(chat)][protection]
 
+                self.api.rebuild_dispatch(chat)
+
                 await self._inline_config(call, chat)
         else:
             current_state = protection in self.api.chats[str(chat)]
@@ -898,6 +3044,8 @@ class HikariChatMod(loader.Module):
                 del self.api.chats[str(chat)][protection]
             else:
                 self.api.chats[str(chat)][protection] = ["on", str(self._me)]
+
+            self.api.rebuild_dispatch(chat)
             await self._inline_config(call, chat)
 
     @error_handler
@@ -989,6 +3137,7 @@ class HikariChatMod(loader.Module):
 
         return t
 
+    @measured()
     async def ban(
         self,
         chat: Union[Chat, int],
@@ -1005,11 +3154,14 @@ class HikariChatMod(loader.Module):
         if reason is None:
             reason = self.strings("no_reason")
 
-        await self._client.edit_permissions(
-            chat,
-            user,
-            until_date=(time.time() + period) if period else 0,
-            **BANNED_RIGHTS,
+        await self.rpc(
+            "ban",
+            lambda: self._client.edit_permissions(
+                chat,
+                user,
+                until_date=(time.time() + period) if period else 0,
+                **BANNED_RIGHTS,
+            ),
         )
 
         if silent:
@@ -1026,53 +3178,66 @@ class HikariChatMod(loader.Module):
         if self._is_inline:
             if self.get("logchat"):
                 if not isinstance(chat, (Chat, Channel)):
-                    chat = await self._client.get_entity(chat)
+                    chat = await self.resolve_entity(chat, chat=True)
 
-                await self.inline.form(
-                    message=self.get("logchat"),
-                    text=self.strings("ban_log").format(
-                        get_link(user),
-                        get_full_name(user),
-                        f"for {period // 60} min(-s)" if period else "forever",
-                        get_link(chat),
-                        get_full_name(chat),
-                        reason,
-                        "",
+                await self.rpc(
+                    "log",
+                    lambda: self.inline.form(
+                        message=self.get("logchat"),
+                        text=self.strings("ban_log").format(
+                            get_link(user),
+                            get_full_name(user),
+                            f"for {period // 60} min(-s)" if period else "forever",
+                            get_link(chat),
+                            get_full_name(chat),
+                            reason,
+                            "",
+                        ),
+                        reply_markup=[
+                            [
+                                {
+                                    "text": self.strings("btn_unban"),
+                                    "data": f"ub/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
+                                }
+                            ]
+                        ],
                     ),
-                    reply_markup=[
-                        [
-                            {
-                                "text": self.strings("btn_unban"),
-                                "data": f"ub/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
-                            }
-                        ]
-                    ],
                 )
 
                 if isinstance(message, Message):
-                    await utils.answer(message, msg)
+                    await self.rpc("send", lambda: utils.answer(message, msg))
                 else:
-                    await self._client.send_message(chat.id, msg)
+                    await self.rpc(
+                        "send",
+                        lambda: self._client.send_message(chat.id, msg),
+                    )
             else:
-                await self.inline.form(
-                    message=message
-                    if isinstance(message, Message)
-                    else getattr(chat, "id", chat),
-                    text=msg,
-                    reply_markup=[
-                        [
-                            {
-                                "text": self.strings("btn_unban"),
-                                "data": f"ub/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
-                            }
-                        ]
-                    ],
+                await self.rpc(
+                    "send",
+                    lambda: self.inline.form(
+                        message=message
+                        if isinstance(message, Message)
+                        else getattr(chat, "id", chat),
+                        text=msg,
+                        reply_markup=[
+                            [
+                                {
+                                    "text": self.strings("btn_unban"),
+                                    "data": f"ub/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
+                                }
+                            ]
+                        ],
+                    ),
                 )
         else:
-            await (utils.answer if message else self._client.send_message)(
-                message or chat.id, msg
+            await self.rpc(
+                "send",
+                lambda: (utils.answer if message else self._client.send_message)(
+                    message or chat.id, msg
+                ),
             )
 
+    @measured()
     async def mute(
         self,
         chat: Union[Chat, int],
@@ -1089,11 +3254,14 @@ class HikariChatMod(loader.Module):
         if reason is None:
             reason = self.strings("no_reason")
 
-        await self._client.edit_permissions(
-            chat,
-            user,
-            until_date=time.time() + period,
-            send_messages=False,
+        await self.rpc(
+            "ban",
+            lambda: self._client.edit_permissions(
+                chat,
+                user,
+                until_date=time.time() + period,
+                send_messages=False,
+            ),
         )
 
         if silent:
@@ -1110,51 +3278,63 @@ class HikariChatMod(loader.Module):
         if self._is_inline:
             if self.get("logchat"):
                 if not isinstance(chat, (Chat, Channel)):
-                    chat = await self._client.get_entity(chat)
+                    chat = await self.resolve_entity(chat, chat=True)
 
-                await self.inline.form(
-                    message=self.get("logchat"),
-                    text=self.strings("mute_log").format(
-                        get_link(user),
-                        get_full_name(user),
-                        f"for {period // 60} min(-s)" if period else "forever",
-                        get_link(chat),
-                        get_full_name(chat),
-                        reason,
-                        "",
+                await self.rpc(
+                    "log",
+                    lambda: self.inline.form(
+                        message=self.get("logchat"),
+                        text=self.strings("mute_log").format(
+                            get_link(user),
+                            get_full_name(user),
+                            f"for {period // 60} min(-s)" if period else "forever",
+                            get_link(chat),
+                            get_full_name(chat),
+                            reason,
+                            "",
+                        ),
+                        reply_markup=[
+                            [
+                                {
+                                    "text": self.strings("btn_unmute"),
+                                    "data": f"um/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
+                                }
+                            ]
+                        ],
                     ),
-                    reply_markup=[
-                        [
-                            {
-                                "text": self.strings("btn_unmute"),
-                                "data": f"um/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
-                            }
-                        ]
-                    ],
                 )
 
                 if isinstance(message, Message):
-                    await utils.answer(message, msg)
+                    await self.rpc("send", lambda: utils.answer(message, msg))
                 else:
-                    await self._client.send_message(chat.id, msg)
+                    await self.rpc(
+                        "send",
+                        lambda: self._client.send_message(chat.id, msg),
+                    )
             else:
-                await self.inline.form(
-                    message=message
-                    if isinstance(message, Message)
-                    else getattr(chat, "id", chat),
-                    text=msg,
-                    reply_markup=[
-                        [
-                            {
-                                "text": self.strings("btn_unmute"),
-                                "data": f"um/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
-                            }
-                        ]
-                    ],
+                await self.rpc(
+                    "send",
+                    lambda: self.inline.form(
+                        message=message
+                        if isinstance(message, Message)
+                        else getattr(chat, "id", chat),
+                        text=msg,
+                        reply_markup=[
+                            [
+                                {
+                                    "text": self.strings("btn_unmute"),
+                                    "data": f"um/{chat.id if isinstance(chat, (Chat, Channel)) else chat}/{user.id}",
+                                }
+                            ]
+                        ],
+                    ),
                 )
         else:
-            await (utils.answer if message else self._client.send_message)(
-                message or chat.id, msg
+            await self.rpc(
+                "send",
+                lambda: (utils.answer if message else self._client.send_message)(
+                    message or chat.id, msg
+                ),
             )
 
     async def actions_callback_handler(self, call: CallbackQuery) -> None:
@@ -1182,25 +3362,29 @@ class HikariChatMod(loader.Module):
             return
 
         try:
-            user = await self._client.get_entity(user)
+            user = await self.resolve_entity(user)
         except Exception:
             await call.answer("Unable to resolve entity")
             return
 
         try:
-            adm = await self._client.get_entity(call.from_user.id)
+            adm = await self.resolve_entity(call.from_user.id)
         except Exception:
             await call.answer("Unable to resolve admin entity")
             return
 
-        p = (
+        p = (await self._admins.get(chat)).get(call.from_user.id) or (
             await self._client(GetParticipantRequest(chat, call.from_user.id))
         ).participant
 
-        owner = isinstance(p, ChannelParticipantCreator)
+        # Basic group admins have no granular rights and can ban anyone
+        full_rights = isinstance(
+            p,
+            (ChannelParticipantCreator, ChatParticipantCreator, ChatParticipantAdmin),
+        )
 
         if action == "ub":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1226,7 +3410,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "um":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1249,7 +3433,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "dw":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1261,6 +3445,7 @@ class HikariChatMod(loader.Module):
                     "args": {"uid": self.api.feds[fed]["uid"], "user": user.id},
                 }
             )
+            self.api.forgive_warn(fed, user.id)
 
             msg = self.strings("inline_unwarned").format(
                 get_link(user),
@@ -1279,7 +3464,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "ufb":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1302,7 +3487,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "ufm":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1327,7 +3512,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "fb":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1350,7 +3535,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "m":
-            if not owner and not p.admin_rights.ban_users:
+            if not full_rights and not p.admin_rights.ban_users:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1371,7 +3556,7 @@ class HikariChatMod(loader.Module):
             except Exception:
                 await self._client.send_message(chat, msg)
         elif action == "d":
-            if not owner and not p.admin_rights.delete_messages:
+            if not full_rights and not p.admin_rights.delete_messages:
                 await call.answer("Not enough rights!")
                 return
 
@@ -1399,7 +3584,7 @@ class HikariChatMod(loader.Module):
 
         if reply and not args:
             return (
-                (await self._client.get_entity(reply.sender_id)),
+                (await self.resolve_entity(reply.sender_id)),
                 0,
                 utils.escape_html(self.strings("no_reason")).strip(),
             )
@@ -1409,9 +3594,9 @@ class HikariChatMod(loader.Module):
             if str(a).isdigit():
                 a = int(a)
             user = (
-                (await self._client.get_entity(reply.sender_id))
+                (await self.resolve_entity(reply.sender_id))
                 if reply
-                else (await self._client.get_entity(a))
+                else (await self.resolve_entity(a))
             )
         except Exception:
             return False
@@ -1433,21 +3618,12 @@ class HikariChatMod(loader.Module):
 
     async def find_fed(self, message: Union[Message, int]) -> None or str:
         """Find if chat belongs to any federation"""
-        return next(
-            (
-                federation
-                for federation, info in self.api.feds.items()
-                if str(
-                    utils.get_chat_id(message)
-                    if isinstance(message, Message)
-                    else message
-                )
-                in list(map(str, info["chats"]))
-            ),
-            None,
+        return self.api.find_fed(
+            utils.get_chat_id(message) if isinstance(message, Message) else message
         )
 
     @error_handler
+    @measured()
     async def punish(
         self,
         chat_id: int,
@@ -1463,39 +3639,75 @@ class HikariChatMod(loader.Module):
         elif action == "fban":
             comment = "f-banned him"
             await self.fbancmd(
-                await self._client.send_message(
-                    chat_id,
-                    f"{self._prefix}fban {user.id} {violation}",
+                await self.rpc(
+                    "send",
+                    lambda: self._client.send_message(
+                        chat_id,
+                        f"{self._prefix}fban {user.id} {violation}",
+                    ),
+                    RPC_CRITICAL,
                 )
             )
         elif action == "delmsg":
             return
         elif action == "kick":
             comment = "kicked him"
-            await self._client.kick_participant(chat_id, user)
+            await self.rpc("kick", lambda: self._client.kick_participant(chat_id, user))
         elif action == "mute":
             comment = "muted him for 1 hour"
             await self.mute(chat_id, user, 60 * 60, violation)
         elif action == "warn":
             comment = "warned him"
-            warn_msg = await self._client.send_message(
-                chat_id, f".warn {user.id} {violation}"
+            warn_msg = await self.rpc(
+                "send",
+                lambda: self._client.send_message(
+                    chat_id, f".warn {user.id} {violation}"
+                ),
+                RPC_CRITICAL,
             )
             await self.allmodules.commands["warn"](warn_msg)
-            await warn_msg.delete()
+            await self.rpc("delete", warn_msg.delete)
         else:
             comment = "just chill 😶‍🌫️"
 
         if not self.config["silent"]:
-            await self._client.send_message(
-                chat_id,
-                self.strings(violation).format(
-                    get_link(user),
-                    user_name,
-                    comment,
+            await self.rpc(
+                "send",
+                lambda: self._client.send_message(
+                    chat_id,
+                    self.strings(violation).format(
+                        get_link(user),
+                        user_name,
+                        comment,
+                    ),
                 ),
             )
 
+    @error_handler
+    async def hcstatscm_(self, message: Message) -> None:
+        """[reset] - Show time spent in protections and other handlers"""
+        if utils.get_args_raw(message) == "reset":
+            latency_stats.reset()
+            await utils.answer(message, self.strings("stats_reset"))
+            return
+
+        rows = "".join(
+            f"<code>{utils.escape_html(name)}</code>: {calls} / {triggers} / "
+            f"{p50 * 1000:.2f} / {p95 * 1000:.2f} / {p99 * 1000:.2f}\n"
+            for name, calls, triggers, _, p50, p95, p99 in latency_stats.summary()
+        )
+
+        await utils.answer(
+            message,
+            self.strings("stats").format(
+                round((time.time() - latency_stats.since) / 60),
+                rows or self.strings("stats_empty"),
+                utils.escape_html(json.dumps(entity_cache.stats())),
+                utils.escape_html(json.dumps(self.api.queue_stats())),
+                utils.escape_html(json.dumps(self._rpc.stats())),
+            ),
+        )
+
     @error_handler
     async def versioncm_(self, message: Message) -> None:
         """Get module info"""
@@ -1519,25 +3731,15 @@ class HikariChatMod(loader.Module):
             await utils.answer(message, self.strings("not_admin"))
             return
 
-        kicked = 0
-
         message = await utils.answer(message, self.strings("cleaning"))
         if not isinstance(message, Message):
             message = message[0]
 
-        async for user in self._client.iter_participants(chat):
-            if user.deleted:
-                try:
-                    await self._client.kick_participant(chat, user)
-                    await self._client.edit_permissions(
-                        chat,
-                        user,
-                        until_date=0,
-                        **{right: True for right in BANNED_RIGHTS.keys()},
-                    )
-                    kicked += 1
-                except Exception:
-                    pass
+        kicked = (await self.sweep_deleted([chat], message, "cleaning"))[0]
+
+        if kicked is None:
+            await utils.answer(message, self.strings("sweep_failed"))
+            return
 
         await utils.answer(message, self.strings("deleted").format(kicked))
 
@@ -1551,83 +3753,49 @@ class HikariChatMod(loader.Module):
             await utils.answer(message, self.strings("no_fed"))
             return
 
-        chats = self.api.feds[fed]["chats"]
-        cleaned_in = []
-        cleaned_in_c = []
-
         message = (await utils.answer(message, self.strings("fcleaning")))[0]
 
-        overall = 0
+        unresolved = set()
+        chats = await self.fed_chats(fed, unresolved=unresolved)
+
+        channels = []
+        for chat in chats:
+            linked = self._linked_channels.channel(chat.id)
+            if linked is None:
+                continue
 
-        for c in chats:
             try:
-                if str(c).isdigit():
-                    c = int(c)
-                chat = await self._client.get_entity(c)
+                channels += [await self.resolve_entity(linked, chat=True)]
             except Exception:
-                continue
+                logger.debug(f"Can't resolve linked channel {linked}", exc_info=True)
+                unresolved.add(linked)
 
-            if not chat.admin_rights and not chat.creator:
-                continue
+        kicked = await self.sweep_deleted(chats + channels, message, "fcleaning")
 
-            try:
-                kicked = 0
-                async for user in self._client.iter_participants(chat):
-                    if user.deleted:
-                        try:
-                            await self._client.kick_participant(chat, user)
-                            await self._client.edit_permissions(
-                                chat,
-                                user,
-                                until_date=0,
-                                **{right: True for right in BANNED_RIGHTS.keys()},
-                            )
-                            kicked += 1
-                        except Exception:
-                            pass
+        cleaned_in = [
+            f'👥 <a href="{get_link(chat)}">{utils.escape_html(chat.title)}</a> - {count}'  # fmt: skip
+            for chat, count in zip(chats, kicked)
+            if count is not None
+        ]
 
-                overall += kicked
-                cleaned_in += [f'👥 <a href="{get_link(chat)}">{utils.escape_html(chat.title)}</a> - {kicked}']  # fmt: skip
-            except UserAdminInvalidError:
-                pass
+        cleaned_in_c = [
+            f'📣 <a href="{get_link(channel)}">{utils.escape_html(channel.title)}</a> - {count}'  # fmt: skip
+            for channel, count in zip(channels, kicked[len(chats) :])
+            if count is not None
+        ]
 
-            if str(c) in self._linked_channels:
-                channel = await self._client.get_entity(self._linked_channels[str(c)])
-                kicked = 0
-                try:
-                    async for user in self._client.iter_participants(
-                        self._linked_channels[str(c)]
-                    ):  # fmt: ski[]
-                        if user.deleted:
-                            try:
-                                await self._client.kick_participant(
-                                    self._linked_channels[str(c)],
-                                    user,
-                                )
-                                await self._client.edit_permissions(
-                                    self._linked_channels[str(c)],
-                                    user,
-                                    until_date=0,
-                                    **{right: True for right in BANNED_RIGHTS.keys()},
-                                )
-                                kicked += 1
-                            except Exception:
-                                pass
-
-                    overall += kicked
-                    cleaned_in_c += [f'📣 <a href="{get_link(channel)}">{utils.escape_html(channel.title)}</a> - {kicked}']  # fmt: skip
-                except ChatAdminRequiredError:
-                    pass
+        failed = kicked.count(None) + len(unresolved)
 
         await utils.answer(
             message,
-            self.strings("deleted").format(overall)
+            self.strings("deleted").format(sum(count or 0 for count in kicked))
             + "\n\n<b>"
             + "\n".join(cleaned_in)
             + "</b>"
             + "\n\n<b>"
             + "\n".join(cleaned_in_c)
-            + "</b>",
+            + "</b>"
+            + (f"\n\n{self.strings('fed_failed').format(failed)}" if failed else ""),
         )
 
     @error_handler
@@ -1720,7 +3888,7 @@ class HikariChatMod(loader.Module):
             try:
                 if str(user).isdigit():
                     user = int(user)
-                obj = await self._client.get_entity(user)
+                obj = await self.resolve_entity(user)
             except Exception:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -1768,7 +3936,7 @@ class HikariChatMod(loader.Module):
             try:
                 if str(user).isdigit():
                     user = int(user)
-                obj = await self._client.get_entity(user)
+                obj = await self.resolve_entity(user)
             except Exception:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -1871,26 +4039,17 @@ class HikariChatMod(loader.Module):
 
         user, t, reason = a
 
-        chats = self.api.feds[fed]["chats"]
-
-        banned_in = []
-
-        for c in chats:
-            try:
-                if str(c).isdigit():
-                    c = int(c)
-                chat = await self._client.get_entity(c)
-            except Exception:
-                continue
+        chats, failed = await self.fed_execute(
+            fed,
+            lambda chat: self.ban(chat, user, t, reason, message, silent=True),
+        )
 
-            if not chat.admin_rights and not chat.creator:
-                continue
+        banned_in = [
+            f'<a href="{get_link(chat)}">{get_full_name(chat)}</a>' for chat in chats
+        ]
 
-            try:
-                await self.ban(chat, user, t, reason, message, silent=True)
-                banned_in += [f'<a href="{get_link(chat)}">{get_full_name(chat)}</a>']
-            except Exception:
-                pass
+        if failed:
+            banned_in += [self.strings("fed_failed").format(failed)]
 
         msg = (
             self.strings("fban").format(
@@ -1948,6 +4107,7 @@ class HikariChatMod(loader.Module):
             },
             message,
         )
+        self.api.clear_warns(fed, user.id)
 
         reply = await message.get_reply_message()
         if reply:
@@ -1978,7 +4138,7 @@ class HikariChatMod(loader.Module):
                 logchat = int(logchat)
 
             try:
-                logchat = await self._client.get_entity(logchat)
+                logchat = await self.resolve_entity(logchat, chat=True)
             except Exception:
                 await utils.answer(message, self.strings("logchat_invalid"))
                 return
@@ -2007,31 +4167,23 @@ class HikariChatMod(loader.Module):
 
         user, t, reason = a
 
-        chats = self.api.feds[fed]["chats"]
-
-        unbanned_in = []
-
-        for c in chats:
-            try:
-                if str(c).isdigit():
-                    c = int(c)
-                chat = await self._client.get_entity(c)
-            except Exception:
-                continue
-
-            if not chat.admin_rights and not chat.creator:
-                continue
-
-            try:
-                await self._client.edit_permissions(
+        chats, failed = await self.fed_execute(
+            fed,
+            lambda chat: self.rpc(
+                "ban",
+                lambda: self._client.edit_permissions(
                     chat,
                     user,
                     until_date=0,
                     **{right: True for right in BANNED_RIGHTS.keys()},
-                )
-                unbanned_in += [chat.title]
-            except UserAdminInvalidError:
-                pass
+                ),
+            ),
+        )
+
+        unbanned_in = [chat.title for chat in chats]
+
+        if failed:
+            unbanned_in += [self.strings("fed_failed").format(failed)]
 
         m = (
             self.strings("funban").format(
@@ -2045,7 +4197,10 @@ class HikariChatMod(loader.Module):
         )
 
         if self.get("logchat"):
-            await self._client.send_message(self.get("logchat"), m)
+            await self.rpc(
+                "log",
+                lambda: self._client.send_message(self.get("logchat"), m),
+            )
 
         await utils.answer(message, m)
 
@@ -2071,26 +4226,17 @@ class HikariChatMod(loader.Module):
 
         user, t, reason = a
 
-        chats = self.api.feds[fed]["chats"]
-
-        muted_in = []
-
-        for c in chats:
-            try:
-                if str(c).isdigit():
-                    c = int(c)
-                chat = await self._client.get_entity(c)
-            except Exception:
-                continue
+        chats, failed = await self.fed_execute(
+            fed,
+            lambda chat: self.mute(chat, user, t, reason, message, silent=True),
+        )
 
-            if not chat.admin_rights and not chat.creator:
-                continue
+        muted_in = [
+            f'<a href="{get_link(chat)}">{get_full_name(chat)}</a>' for chat in chats
+        ]
 
-            try:
-                await self.mute(chat, user, t, reason, message, silent=True)
-                muted_in += [f'<a href="{get_link(chat)}">{get_full_name(chat)}</a>']
-            except Exception:
-                pass
+        if failed:
+            muted_in += [self.strings("fed_failed").format(failed)]
 
         msg = (
             self.strings("fmute").format(
@@ -2163,31 +4309,23 @@ class HikariChatMod(loader.Module):
 
         user, t, reason = a
 
-        chats = self.api.feds[fed]["chats"]
-
-        unbanned_in = []
-
-        for c in chats:
-            try:
-                if str(c).isdigit():
-                    c = int(c)
-                chat = await self._client.get_entity(c)
-            except Exception:
-                continue
-
-            if not chat.admin_rights and not chat.creator:
-                continue
-
-            try:
-                await self._client.edit_permissions(
+        chats, failed = await self.fed_execute(
+            fed,
+            lambda chat: self.rpc(
+                "ban",
+                lambda: self._client.edit_permissions(
                     chat,
                     user,
                     until_date=0,
                     **{right: True for right in BANNED_RIGHTS.keys()},
-                )
-                unbanned_in += [chat.title]
-            except UserAdminInvalidError:
-                pass
+                ),
+            ),
+        )
+
+        unbanned_in = [chat.title for chat in chats]
+
+        if failed:
+            unbanned_in += [self.strings("fed_failed").format(failed)]
 
         msg = (
             self.strings("funmute").format(
@@ -2203,7 +4341,10 @@ class HikariChatMod(loader.Module):
         await utils.answer(message, msg)
 
         if self.get("logchat"):
-            await self._client.send_message(self.get("logchat"), msg)
+            await self.rpc(
+                "log",
+                lambda: self._client.send_message(self.get("logchat"), msg),
+            )
 
         reply = await message.get_reply_message()
         if reply:
@@ -2225,13 +4366,13 @@ class HikariChatMod(loader.Module):
 
         try:
             if reply:
-                user = await self._client.get_entity(reply.sender_id)
+                user = await self.resolve_entity(reply.sender_id)
                 reason = args or self.strings
             else:
                 uid = args.split(maxsplit=1)[0]
                 if str(uid).isdigit():
                     uid = int(uid)
-                user = await self._client.get_entity(uid)
+                user = await self.resolve_entity(uid)
                 reason = (
                     args.split(maxsplit=1)[1]
                     if len(args.split(maxsplit=1)) > 1
@@ -2330,10 +4471,10 @@ class HikariChatMod(loader.Module):
         try:
             if args.isdigit():
                 args = int(args)
-            user = await self._client.get_entity(args)
+            user = await self.resolve_entity(args)
         except Exception:
             try:
-                user = await self._client.get_entity(reply.sender_id)
+                user = await self.resolve_entity(reply.sender_id)
             except Exception:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2376,10 +4517,10 @@ class HikariChatMod(loader.Module):
         try:
             if args.isdigit():
                 args = int(args)
-            user = await self._client.get_entity(args)
+            user = await self.resolve_entity(args)
         except Exception:
             try:
-                user = await self._client.get_entity(reply.sender_id)
+                user = await self.resolve_entity(reply.sender_id)
             except Exception:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2428,7 +4569,7 @@ class HikariChatMod(loader.Module):
                 try:
                     if str(chat).isdigit():
                         chat = int(chat)
-                    c = await self._client.get_entity(chat)
+                    c = await self.resolve_entity(chat, chat=True)
                 except Exception:
                     continue
 
@@ -2458,14 +4599,27 @@ class HikariChatMod(loader.Module):
 
         fed = args
 
+        admins_entities, chats_entities = await asyncio.gather(
+            self.resolve_entities(self.api.feds[fed]["admins"]),
+            self.resolve_entities(self.api.feds[fed]["chats"], chats=True),
+        )
+        chats_entities = [c for c in chats_entities if c is not None]
+        channels_entities = await self.resolve_entities(
+            (
+                linked
+                for linked in (
+                    self._linked_channels.channel(c.id) for c in chats_entities
+                )
+                if linked is not None
+            ),
+            chats=True,
+        )
+
         admins = ""
-        for admin in self.api.feds[fed]["admins"]:
-            try:
-                if str(admin).isdigit():
-                    admin = int(admin)
-                user = await self._client.get_entity(admin)
-            except Exception:
+        for user in admins_entities:
+            if user is None:
                 continue
+
             name = get_full_name(user)
             status = (
                 "<code> 🧃 online</code>"
@@ -2474,28 +4628,15 @@ class HikariChatMod(loader.Module):
             )
             admins += f' <b>👤 <a href="{get_link(user)}">{name}</a></b>{status}\n'
 
-        chats = ""
-        channels = ""
-        for chat in self.api.feds[fed]["chats"]:
-            try:
-                if str(chat).isdigit():
-                    chat = int(chat)
-                c = await self._client.get_entity(chat)
-            except Exception:
-                continue
-
-            if str(chat) in self._linked_channels:
-                try:
-                    channel = await self._client.get_entity(
-                        self._linked_channels[str(chat)]
-                    )
-                    channels += f' <b>📣 <a href="{get_link(channel)}">{utils.escape_html(channel.title)}</a></b>\n'
-                except Exception:
-                    pass
-
-            chats += (
-                f' <b>🫂 <a href="{get_link(c)}">{utils.escape_html(c.title)}</a></b>\n'
-            )
+        chats = "".join(
+            f' <b>🫂 <a href="{get_link(c)}">{utils.escape_html(c.title)}</a></b>\n'
+            for c in chats_entities
+        )
+        channels = "".join(
+            f' <b>📣 <a href="{get_link(channel)}">{utils.escape_html(channel.title)}</a></b>\n'  # fmt: skip
+            for channel in channels_entities
+            if channel is not None
+        )
 
         await utils.answer(
             message,
@@ -2536,7 +4677,7 @@ class HikariChatMod(loader.Module):
         reply = await message.get_reply_message()
         user = None
         if reply:
-            user = await self._client.get_entity(reply.sender_id)
+            user = await self.resolve_entity(reply.sender_id)
             reason = args or self.strings("no_reason")
         else:
             try:
@@ -2544,7 +4685,7 @@ class HikariChatMod(loader.Module):
                 if u.isdigit():
                     u = int(u)
 
-                user = await self._client.get_entity(u)
+                user = await self.resolve_entity(u)
             except IndexError:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2571,31 +4712,42 @@ class HikariChatMod(loader.Module):
             },
             message,
         )
-        warns = self.api.feds[fed]["warns"].get(str(user.id), []) + [reason]
+        warns = self.api.add_warn(fed, user.id, reason)
 
         if len(warns) >= 7:
             user_name = get_first_name(user)
-            chats = self.api.feds[fed]["chats"]
-            for c in chats:
-                await self._client(
-                    EditBannedRequest(
-                        c,
-                        user,
-                        ChatBannedRights(
-                            until_date=time.time() + 60**2 * 24,
-                            send_messages=True,
-                        ),
-                    )
+
+            async def escalate(chat: Union[Chat, Channel]) -> None:
+                await self.rpc(
+                    "ban",
+                    lambda: self._client(
+                        EditBannedRequest(
+                            chat,
+                            user,
+                            ChatBannedRights(
+                                until_date=time.time() + 60**2 * 24,
+                                send_messages=True,
+                            ),
+                        )
+                    ),
                 )
 
-                await self._client.send_message(
-                    c,
-                    self.strings("warns_limit").format(
-                        get_link(user), user_name, "muted him for 24 hours"
+                await self.rpc(
+                    "send",
+                    lambda: self._client.send_message(
+                        chat,
+                        self.strings("warns_limit").format(
+                            get_link(user), user_name, "muted him for 24 hours"
+                        ),
                     ),
                 )
 
-            await message.delete()
+            _, failed = await self.fed_execute(fed, escalate, check_rights=False)
+
+            if failed:
+                await utils.answer(message, self.strings("fed_failed").format(failed))
+            else:
+                await message.delete()
 
             self.api.request(
                 {
@@ -2604,6 +4756,7 @@ class HikariChatMod(loader.Module):
                 },
                 message,
             )
+            self.api.clear_warns(fed, user.id)
         else:
             msg = self.strings("fwarn", message).format(
                 get_link(user),
@@ -2665,12 +4818,21 @@ class HikariChatMod(loader.Module):
             await utils.answer(message, self.strings("no_fed"))
             return
 
-        warns = self.api.feds[fed]["warns"]
+        warns = self.api.warns(fed)
 
         if not warns:
             await utils.answer(message, self.strings("no_fed_warns"))
             return
 
+        def format_warns(user_warns: UserWarns) -> str:
+            return "".join(
+                "<code>   </code>🏴󠁧󠁢󠁥󠁮󠁧󠁿 <i>"
+                + warn
+                + (f" </i><b>[x{count}]</b><i>" if count > 1 else "")
+                + "</i>\n"
+                for warn, count in user_warns.grouped()
+            )
+
         async def send_user_warns(usid):
             try:
                 if int(usid) < 0:
@@ -2683,7 +4845,7 @@ class HikariChatMod(loader.Module):
                 return
 
             if str(usid) not in warns or not warns[str(usid)]:
-                user_obj = await self._client.get_entity(usid)
+                user_obj = await self.resolve_entity(usid)
                 await utils.answer(
                     message,
                     self.strings("no_warns").format(
@@ -2691,23 +4853,7 @@ class HikariChatMod(loader.Module):
                     ),
                 )
             else:
-                user_obj = await self._client.get_entity(usid)
-                _warns = ""
-                processed = []
-                for warn in warns[str(usid)].copy():
-                    if warn in processed:
-                        continue
-                    processed += [warn]
-                    _warns += (
-                        "<code>   </code>🏴󠁧󠁢󠁥󠁮󠁧󠁿 <i>"
-                        + warn
-                        + (
-                            f" </i><b>[x{warns[str(usid)].count(warn)}]</b><i>"
-                            if warns[str(usid)].count(warn) > 1
-                            else ""
-                        )
-                        + "</i>\n"
-                    )
+                user_obj = await self.resolve_entity(usid)
                 await utils.answer(
                     message,
                     self.strings("warns").format(
@@ -2715,7 +4861,7 @@ class HikariChatMod(loader.Module):
                         get_full_name(user_obj),
                         len(warns[str(usid)]),
                         7,
-                        _warns,
+                        format_warns(warns[str(usid)]),
                     ),
                 )
 
@@ -2725,11 +4871,11 @@ class HikariChatMod(loader.Module):
             reply = await message.get_reply_message()
             args = utils.get_args_raw(message)
             if not reply and not args:
-                res = self.strings("warns_adm_fed")
-                for user, _warns in warns.copy().items():
-                    try:
-                        user_obj = await self._client.get_entity(int(user))
-                    except Exception:
+                res = [self.strings("warns_adm_fed")]
+                users = list(warns.copy().items())
+                entities = await self.resolve_entities(int(user) for user, _ in users)
+                for (user, _warns), user_obj in zip(users, entities):
+                    if user_obj is None:
                         continue
 
                     if isinstance(user_obj, User):
@@ -2740,24 +4886,12 @@ class HikariChatMod(loader.Module):
                     else:
                         name = user_obj.title
 
-                    res += f'🐺 <b><a href="{get_link(user_obj)}">' + name + "</a></b>\n"
-                    processed = []
-                    for warn in _warns.copy():
-                        if warn in processed:
-                            continue
-                        processed += [warn]
-                        res += (
-                            "<code>   </code>🏴󠁧󠁢󠁥󠁮󠁧󠁿 <i>"
-                            + warn
-                            + (
-                                f" </i><b>[x{_warns.count(warn)}]</b><i>"
-                                if _warns.count(warn) > 1
-                                else ""
-                            )
-                            + "</i>\n"
-                        )
+                    res += [
+                        f'🐺 <b><a href="{get_link(user_obj)}">{name}</a></b>\n',
+                        format_warns(_warns),
+                    ]
 
-                await utils.answer(message, res)
+                await utils.answer(message, "".join(res))
                 return
             elif reply:
                 await send_user_warns(reply.sender_id)
@@ -2773,13 +4907,13 @@ class HikariChatMod(loader.Module):
         user = None
 
         if reply:
-            user = await self._client.get_entity(reply.sender_id)
+            user = await self.resolve_entity(reply.sender_id)
         else:
             if args.isdigit():
                 args = int(args)
 
             try:
-                user = await self._client.get_entity(args)
+                user = await self.resolve_entity(args)
             except IndexError:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2797,13 +4931,17 @@ class HikariChatMod(loader.Module):
             },
             message,
         )
+        self.api.forgive_warn(fed, user.id)
 
         msg = self.strings("dwarn_fed").format(get_link(user), get_first_name(user))
 
         await utils.answer(message, msg)
 
         if self.get("logchat", False):
-            await self._client.send_message(self.get("logchat"), msg)
+            await self.rpc(
+                "log",
+                lambda: self._client.send_message(self.get("logchat"), msg),
+            )
 
     @error_handler
     @chat_command
@@ -2813,13 +4951,13 @@ class HikariChatMod(loader.Module):
         reply = await message.get_reply_message()
         user = None
         if reply:
-            user = await self._client.get_entity(reply.sender_id)
+            user = await self.resolve_entity(reply.sender_id)
         else:
             if args.isdigit():
                 args = int(args)
 
             try:
-                user = await self._client.get_entity(args)
+                user = await self.resolve_entity(args)
             except IndexError:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2837,6 +4975,7 @@ class HikariChatMod(loader.Module):
             },
             message,
         )
+        self.api.clear_warns(fed, user.id)
 
         await utils.answer(
             message,
@@ -2860,6 +4999,7 @@ class HikariChatMod(loader.Module):
             },
             message,
         )
+        self.api.clear_warns(fed)
 
         await utils.answer(message, self.strings("clrallwarns_fed"))
 
@@ -2897,13 +5037,13 @@ class HikariChatMod(loader.Module):
         reply = await message.get_reply_message()
         user = None
         if reply:
-            user = await self._client.get_entity(reply.sender_id)
+            user = await self.resolve_entity(reply.sender_id)
         else:
             if str(args).isdigit():
                 args = int(args)
 
             try:
-                user = await self._client.get_entity(args)
+                user = await self.resolve_entity(args)
             except Exception:
                 await utils.answer(message, self.strings("args"))
                 return
@@ -2921,7 +5061,7 @@ class HikariChatMod(loader.Module):
             self.strings("defense").format(
                 get_link(user),
                 get_first_name(user),
-                "on" if str(user.id) not in self.api.feds[fed]["fdef"] else "off",
+                "on" if user.id not in self.api.fdef(fed) else "off",
             ),
         )
 
@@ -2941,6 +5081,7 @@ class HikariChatMod(loader.Module):
             await utils.answer(message, self.strings("fsave_args"))
             return
 
+        self.api.forget_note(fed, args)
         self.api.request(
             {
                 "action": "new note",
@@ -2970,6 +5111,7 @@ class HikariChatMod(loader.Module):
             await utils.answer(message, self.strings("fstop_args"))
             return
 
+        self.api.forget_note(fed, args)
         self.api.request(
             {
                 "action": "delete note",
@@ -2991,25 +5133,26 @@ class HikariChatMod(loader.Module):
             return
 
         res = {}
-        cache = {}
 
-        for shortname, note in self.api.feds[fed].get("notes", {}).items():
-            if int(note["creator"]) != self._me and from_watcher:
-                continue
+        notes = [
+            (shortname, int(note["creator"]))
+            for shortname, note in self.api.feds[fed].get("notes", {}).items()
+            if int(note["creator"]) == self._me or not from_watcher
+        ]
+
+        creators = list({creator for _, creator in notes})
+        cache = dict(zip(creators, await self.resolve_entities(creators)))
 
+        for shortname, creator in notes:
+            obj = cache[creator]
             try:
-                if int(note["creator"]) not in cache:
-                    obj = await self._client.get_entity(int(note["creator"]))
-                    cache[int(note["creator"])] = obj.first_name or obj.title
-                key = f'<a href="{get_link(obj)}">{cache[int(note["creator"])]}</a>'
-                if key not in res:
-                    res[key] = ""
-                res[key] += f"  <code>{shortname}</code>\n"
+                key = f'<a href="{get_link(obj)}">{obj.first_name or obj.title}</a>'
             except Exception:
                 key = "unknown"
-                if key not in res:
-                    res[key] = ""
-                res[key] += f"  <code>{shortname}</code>\n"
+
+            if key not in res:
+                res[key] = ""
+            res[key] += f"  <code>{shortname}</code>\n"
 
         notes = "".join(f"\nby {owner}:\n{note}" for owner, note in res.items())
         if not notes:
@@ -3032,10 +5175,16 @@ class HikariChatMod(loader.Module):
             return
 
         res = ""
-        for user in self.api.feds[fed].get("fdef", []).copy():
-            try:
-                u = await self._client.get_entity(int(user))
-            except Exception:
+        users = self.api.feds[fed].get("fdef", []).copy()
+        gone = set()
+        entities = await self.resolve_entities((int(user) for user in users), gone)
+        for i, (user, u) in enumerate(zip(users, entities)):
+            if u is None and i not in gone:
+                # Lookup failed, but user may still exist, so keep protection
+                res += f"  🇻🇦 <code>{user}</code>\n"
+                continue
+
+            if u is None:
                 self.api.request(
                     {
                         "action": "protect user",
@@ -3144,34 +5293,38 @@ class HikariChatMod(loader.Module):
                 ]
             ]
 
-        await self._client.send_file(
-            message.peer_id,
-            render_table(
+        pages = await asyncio.get_event_loop().run_in_executor(
+            None,
+            render_table_pages,
+            [
                 [
-                    [
-                        "Chat",
-                        "change_info",
-                        "delete_messages",
-                        "ban_users",
-                        "invite_users",
-                        "pin_messages",
-                        "add_admins",
-                    ]
+                    "Chat",
+                    "change_info",
+                    "delete_messages",
+                    "ban_users",
+                    "invite_users",
+                    "pin_messages",
+                    "add_admins",
                 ]
-                + rights
-            ),
+            ]
+            + rights,
         )
 
+        for album in chunks(pages, 10):
+            await self._client.send_file(message.peer_id, album)
+
         if message.out:
             await message.delete()
 
+    @measured()
     @error_handler
     async def p__antiservice(self, chat_id: Union[str, int], message: Message) -> None:
         if self.api.should_protect(chat_id, "antiservice") and getattr(
             message, "action_message", False
         ):
-            await message.delete()
+            await self.rpc("delete", message.delete)
 
+    @measured()
     @error_handler
     async def p__banninja(
         self,
@@ -3182,11 +5335,8 @@ class HikariChatMod(loader.Module):
         chat: Union[Chat, Channel],
     ) -> bool:
         if not (
-            self.api.should_protect(chat_id, "banninja")
-            and (
-                getattr(message, "user_joined", False)
-                or getattr(message, "user_added", False)
-            )
+            getattr(message, "user_joined", False)
+            or getattr(message, "user_added", False)
         ):
             return False
 
@@ -3200,20 +5350,9 @@ class HikariChatMod(loader.Module):
 
             del self._ban_ninja[chat_id]
 
-        if chat_id not in self._join_ratelimit:
-            self._join_ratelimit[chat_id] = []
-
-        self._join_ratelimit[chat_id] += [(user_id, round(time.time()))]
-
-        processed = []
-
-        for u, t in self._join_ratelimit[chat_id].copy():
-            if u in processed or t + 60 < time.time():
-                self._join_ratelimit[chat_id].remove((u, t))
-            else:
-                processed += [u]
-
-        if len(self._join_ratelimit) > int(self.config["join_ratelimit"]):
+        if self._join_ratelimit.hit(int(chat_id), int(user_id)) > int(
+            self.config["join_ratelimit"]
+        ):
             if not await self.check_admin(
                 utils.get_chat_id(message),
                 f"@{self.inline.bot_username}",
@@ -3242,24 +5381,31 @@ class HikariChatMod(loader.Module):
                 except Exception:
                     logger.exception("Cleaner promotion failed!")
                     return False
+                finally:
+                    self._admins.invalidate(utils.get_chat_id(message))
 
             self._ban_ninja[chat_id] = round(time.time()) + (10 * 60)
-            await self.inline.form(
-                self.strings("smart_anti_raid_active"),
-                message=chat.id,
-                reply_markup=[
-                    [
-                        {
-                            "text": self.strings("smart_anti_raid_off"),
-                            "callback": self.disable_smart_anti_raid,
-                            "args": (chat_id,),
-                        }
-                    ]
-                ],
+            self._join_ratelimit.reset(int(chat_id))
+            await self.rpc(
+                "send",
+                lambda: self.inline.form(
+                    self.strings("smart_anti_raid_active"),
+                    message=chat.id,
+                    reply_markup=[
+                        [
+                            {
+                                "text": self.strings("smart_anti_raid_off"),
+                                "callback": self.disable_smart_anti_raid,
+                                "args": (chat_id,),
+                            }
+                        ]
+                    ],
+                ),
             )
 
         return False
 
+    @measured()
     @error_handler
     async def p__antiraid(
         self,
@@ -3269,34 +5415,46 @@ class HikariChatMod(loader.Module):
         message: Message,
         chat: Union[Chat, Channel],
     ) -> bool:
-        if self.api.should_protect(chat_id, "antiraid") and (
+        if (
             getattr(message, "user_joined", False)
             or getattr(message, "user_added", False)
         ):
             action = self.api.chats[str(chat_id)]["antiraid"]
             if action == "kick":
-                await self._client.send_message(
-                    "me",
-                    self.strings("antiraid").format(
-                        "kicked", user.id, get_full_name(user), chat.title
+                await self.rpc(
+                    "log",
+                    lambda: self._client.send_message(
+                        "me",
+                        self.strings("antiraid").format(
+                            "kicked", user.id, get_full_name(user), chat.title
+                        ),
                     ),
                 )
 
-                await self._client.kick_participant(chat_id, user)
+                await self.rpc(
+                    "kick",
+                    lambda: self._client.kick_participant(chat_id, user),
+                )
             elif action == "ban":
-                await self._client.send_message(
-                    "me",
-                    self.strings("antiraid").format(
-                        "banned", user.id, get_full_name(user), chat.title
+                await self.rpc(
+                    "log",
+                    lambda: self._client.send_message(
+                        "me",
+                        self.strings("antiraid").format(
+                            "banned", user.id, get_full_name(user), chat.title
+                        ),
                     ),
                 )
 
                 await self.ban(chat, user, 0, "antiraid")
             elif action == "mute":
-                await self._client.send_message(
-                    "me",
-                    self.strings("antiraid").format(
-                        "muted", user.id, get_full_name(user), chat.title
+                await self.rpc(
+                    "log",
+                    lambda: self._client.send_message(
+                        "me",
+                        self.strings("antiraid").format(
+                            "muted", user.id, get_full_name(user), chat.title
+                        ),
                     ),
                 )
 
@@ -3306,6 +5464,7 @@ class HikariChatMod(loader.Module):
 
         return False
 
+    @measured()
     @error_handler
     async def p__welcome(
         self,
@@ -3315,25 +5474,30 @@ class HikariChatMod(loader.Module):
         message: Message,
         chat: Chat,
     ) -> bool:
-        if self.api.should_protect(chat_id, "welcome") and (
+        if (
             getattr(message, "user_joined", False)
             or getattr(message, "user_added", False)
         ):
-            await self._client.send_message(
-                chat_id,
-                self.api.chats[str(chat_id)]["welcome"][0]
-                .replace("{user}", get_full_name(user))
-                .replace("{chat}", utils.escape_html(chat.title))
-                .replace(
-                    "{mention}", f'<a href="{get_link(user)}">{get_full_name(user)}</a>'
+            await self.rpc(
+                "send",
+                lambda: self._client.send_message(
+                    chat_id,
+                    self.api.chats[str(chat_id)]["welcome"][0]
+                    .replace("{user}", get_full_name(user))
+                    .replace("{chat}", utils.escape_html(chat.title))
+                    .replace(
+                        "{mention}",
+                        f'<a href="{get_link(user)}">{get_full_name(user)}</a>',
+                    ),
+                    reply_to=message.action_message.id,
                 ),
-                reply_to=message.action_message.id,
             )
 
             return True
 
         return False
 
+    @measured()
     @error_handler
     async def p__report(
         self,
@@ -3342,9 +5506,7 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> None:
-        if not self.api.should_protect(chat_id, "report") or not getattr(
-            message, "reply_to_msg_id", False
-        ):
+        if not getattr(message, "reply_to_msg_id", False):
             return
 
         reply = await message.get_reply_message()
@@ -3358,7 +5520,7 @@ class HikariChatMod(loader.Module):
             )
             and reply
         ):
-            chat = await message.get_chat()
+            chat = await self.resolve_entity(message.chat_id)
 
             reason = (
                 message.raw_text.split(maxsplit=1)[1]
@@ -3389,42 +5551,49 @@ class HikariChatMod(loader.Module):
             )
 
             if self._is_inline:
-                await self.inline.form(
-                    message=chat.id,
-                    text=msg,
-                    reply_markup=[
-                        [
-                            {
-                                "text": self.strings("btn_mute"),
-                                "data": f"m/{chat.id}/{reply.sender_id}#{reply.id}",
-                            },
-                            {
-                                "text": self.strings("btn_ban"),
-                                "data": f"b/{chat.id}/{reply.sender_id}#{reply.id}",
-                            },
-                        ],
-                        [
-                            {
-                                "text": self.strings("btn_fban"),
-                                "data": f"fb/{chat.id}/{reply.sender_id}#{reply.id}",
-                            },
-                            {
-                                "text": self.strings("btn_del"),
-                                "data": f"d/{chat.id}/{reply.sender_id}#{reply.id}",
-                            },
+                await self.rpc(
+                    "send",
+                    lambda: self.inline.form(
+                        message=chat.id,
+                        text=msg,
+                        reply_markup=[
+                            [
+                                {
+                                    "text": self.strings("btn_mute"),
+                                    "data": f"m/{chat.id}/{reply.sender_id}#{reply.id}",
+                                },
+                                {
+                                    "text": self.strings("btn_ban"),
+                                    "data": f"b/{chat.id}/{reply.sender_id}#{reply.id}",
+                                },
+                            ],
+                            [
+                                {
+                                    "text": self.strings("btn_fban"),
+                                    "data": f"fb/{chat.id}/{reply.sender_id}#{reply.id}",
+                                },
+                                {
+                                    "text": self.strings("btn_del"),
+                                    "data": f"d/{chat.id}/{reply.sender_id}#{reply.id}",
+                                },
+                            ],
                         ],
-                    ],
-                    ttl=15,
+                        ttl=15,
+                    ),
                 )
             else:
-                await (utils.answer if message else self._client.send_message)(
-                    message or chat.id, msg
+                await self.rpc(
+                    "send",
+                    lambda: (utils.answer if message else self._client.send_message)(
+                        message or chat.id, msg
+                    ),
                 )
 
             self._ratelimit["report"][str(user_id)] = time.time() + 30
 
-            await message.delete()
+            await self.rpc("delete", message.delete)
 
+    @measured()
     @error_handler
     async def p__antiflood(
         self,
@@ -3433,28 +5602,15 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> Union[bool, str]:
-        if self.api.should_protect(chat_id, "antiflood"):
-            if str(chat_id) not in self.flood_cache:
-                self.flood_cache[str(chat_id)] = {}
+        flooding = self.flood_cache.hit(int(chat_id), int(user_id))
+        self._flood_store.mark_dirty()
 
-            if str(user_id) not in self.flood_cache[str(chat_id)]:
-                self.flood_cache[str(chat_id)][str(user_id)] = []
-
-            for item in self.flood_cache[str(chat_id)][str(user_id)].copy():
-                if time.time() - item > self.flood_timeout:
-                    self.flood_cache[str(chat_id)][str(user_id)].remove(item)
-
-            self.flood_cache[str(chat_id)][str(user_id)].append(round(time.time(), 2))
-            self.save_flood_cache()
-
-            if (
-                len(self.flood_cache[str(chat_id)][str(user_id)])
-                >= self.flood_threshold
-            ):
-                return self.api.chats[str(chat_id)]["antiflood"][0]
+        if flooding:
+            return self.api.chats[str(chat_id)]["antiflood"][0]
 
         return False
 
+    @measured()
     @error_handler
     async def p__antichannel(
         self,
@@ -3463,16 +5619,14 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> bool:
-        if (
-            self.api.should_protect(chat_id, "antichannel")
-            and getattr(message, "sender_id", 0) < 0
-        ):
+        if getattr(message, "sender_id", 0) < 0:
             await self.ban(chat_id, user_id, 0, "", None, True)
-            await message.delete()
+            await self.rpc("delete", message.delete)
             return True
 
         return False
 
+    @measured()
     @error_handler
     async def p__antigif(
         self,
@@ -3481,19 +5635,19 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> bool:
-        if self.api.should_protect(chat_id, "antigif"):
-            try:
-                if (
-                    message.media
-                    and DocumentAttributeAnimated() in message.media.document.attributes
-                ):
-                    await message.delete()
-                    return True
-            except Exception:
-                pass
+        try:
+            if (
+                message.media
+                and DocumentAttributeAnimated() in message.media.document.attributes
+            ):
+                await self.rpc("delete", message.delete)
+                return True
+        except Exception:
+            pass
 
         return False
 
+    @measured()
     @error_handler
     async def p__antispoiler(
         self,
@@ -3502,16 +5656,16 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> bool:
-        if self.api.should_protect(chat_id, "antispoiler"):
-            try:
-                if any(isinstance(_, MessageEntitySpoiler) for _ in message.entities):
-                    await message.delete()
-                    return True
-            except Exception:
-                pass
+        try:
+            if any(isinstance(_, MessageEntitySpoiler) for _ in message.entities):
+                await self.rpc("delete", message.delete)
+                return True
+        except Exception:
+            pass
 
         return False
 
+    @measured()
     @error_handler
     async def p__antiexplicit(
         self,
@@ -3520,51 +5674,71 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> Union[bool, str]:
-        if self.api.should_protect(chat_id, "antiexplicit"):
-            text = getattr(message, "raw_text", "")
-            P = "пПnPp"
-            I = "иИiI1uІИ́Їіи́ї"  # noqa: E741
-            E = "еЕeEЕ́е́"
-            D = "дДdD"
-            Z = "зЗ3zZ3"
-            M = "мМmM"
-            U = "уУyYuUУ́у́"
-            O = "оОoO0О́о́"  # noqa: E741
-            L = "лЛlL1"
-            A = "аАaAА́а́@"
-            N = "нНhH"
-            G = "гГgG"
-            K = "кКkK"
-            R = "рРpPrR"
-            H = "хХxXhH"
-            YI = "йЙyуУY"
-            YA = "яЯЯ́я́"
-            YO = "ёЁ"
-            YU = "юЮЮ́ю́"
-            B = "бБ6bB"
-            T = "тТtT1"
-            HS = "ъЪ"
-            SS = "ьЬ"
-            Y = "ыЫ"
-
-            occurrences = re.findall(
-                rf"""\b[0-9]*(\w*[{P}][{I}{E}][{Z}][{D}]\w*|(?:[^{I}{U}\s]+|{N}{I})?(?<!стра)[{H}][{U}][{YI}{E}{YA}{YO}{I}{L}{YU}](?!иг)\w*|\w*[{B}][{L}](?:[{YA}]+[{D}{T}]?|[{I}]+[{D}{T}]+|[{I}]+[{A}]+)(?!х)\w*|(?:\w*[{YI}{U}{E}{A}{O}{HS}{SS}{Y}{YA}][{E}{YO}{YA}{I}][{B}{P}](?!ы\b|ол)\w*|[{E}{YO}][{B}]\w*|[{I}][{B}][{A}]\w+|[{YI}][{O}][{B}{P}]\w*)|\w*(?:[{P}][{I}{E}][{D}][{A}{O}{E}]?[{R}](?!о)\w*|[{P}][{E}][{D}][{E}{I}]?[{G}{K}])|\w*[{Z}][{A}{O}][{L}][{U}][{P}]\w*|\w*[{M}][{A}][{N}][{D}][{A}{O}]\w*|\w*[{G}][{O}{A}][{N}][{D}][{O}][{N}]\w*)""",
-                text,
-            )
+        if self.api.explicit.check(getattr(message, "raw_text", "") or ""):
+            return self.api.chats[str(chat_id)]["antiexplicit"][0]
 
-            occurrences = [
-                word
-                for word in occurrences
-                if all(
-                    excl not in word for excl in self.api.variables["censor_exclusions"]
-                )
-            ]
+        return False
 
-            if occurrences:
-                return self.api.chats[str(chat_id)]["antiexplicit"][0]
+    async def _nsfw_verdict(self, message: Message) -> Union[str, None]:
+        """Get NSFW verdict of message media, downloading as little as possible"""
+        source = nsfw_source(message)
+        if source is None:
+            return None
 
-        return False
+        media_key, thumb = source
+
+        response = self._nsfw_cache.get("media", media_key)
+        if response is not None:
+            return response
+
+        photo = io.BytesIO()
+        await self._client.download_media(message, photo, thumb=thumb)
+        photo.seek(0)
+
+        if photo.getbuffer().nbytes > NSFW_MAX_BYTES:
+            return None
+
+        if imghdr.what(photo) not in self.api.variables["image_types"]:
+            response = "sfw"
+        else:
+            phash = perceptual_hash(photo)
+            response = self._nsfw_cache.get("hash", phash)
+            if response is None:
+                response = await self.api.nsfw(photo)
+                if response is not None:
+                    self._nsfw_cache.put("hash", phash, response)
+
+        if response is not None:
+            self._nsfw_cache.put("media", media_key, response)
+            self._nsfw_store.mark_dirty()
+
+        return response
+
+    async def _check_album(self, message: Message) -> dict:
+        """
+        Check all media of album concurrently
+        :return: {message id: verdict}
+        """
+        album = [
+            m
+            for m in await self._client.get_messages(
+                message.peer_id,
+                ids=list(range(message.id - 9, message.id + 10)),
+            )
+            if m and m.grouped_id == message.grouped_id
+        ] or [message]
+
+        verdicts = await asyncio.gather(
+            *[self._nsfw_verdict(m) for m in album],
+            return_exceptions=True,
+        )
+
+        return {
+            m.id: None if isinstance(verdict, Exception) else verdict
+            for m, verdict in zip(album, verdicts)
+        }
 
+    @measured()
     @error_handler
     async def p__antinsfw(
         self,
@@ -3573,27 +5747,28 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> Union[bool, str]:
-        if not self.api.should_protect(chat_id, "antinsfw"):
-            return False
-
-        media = False
-
-        if getattr(message, "sticker", False):
-            media = message.sticker
-        elif getattr(message, "media", False):
-            media = message.media
-
-        if not media:
-            return False
-
-        photo = io.BytesIO()
-        await self._client.download_media(message.media, photo)
-        photo.seek(0)
+        grouped_id = getattr(message, "grouped_id", None)
+        if grouped_id:
+            if grouped_id not in self._albums:
+                self._albums[grouped_id] = asyncio.ensure_future(
+                    self._check_album(message)
+                )
+                asyncio.get_event_loop().call_later(
+                    60,
+                    self._albums.pop,
+                    grouped_id,
+                    None,
+                )
 
-        if imghdr.what(photo) not in self.api.variables["image_types"]:
-            return False
+            verdicts = await asyncio.shield(self._albums[grouped_id])
+            response = (
+                verdicts[message.id]
+                if message.id in verdicts
+                else await self._nsfw_verdict(message)
+            )
+        else:
+            response = await self._nsfw_verdict(message)
 
-        response = await self.api.nsfw(photo)
         if response != "nsfw":
             return False
 
@@ -3607,14 +5782,18 @@ class HikariChatMod(loader.Module):
             if _.sender_id != message.sender_id:
                 break
 
-        await self._client.delete_messages(
-            message.peer_id,
-            message_ids=todel,
-            revoke=True,
+        await self.rpc(
+            "delete",
+            lambda: self._client.delete_messages(
+                message.peer_id,
+                message_ids=todel,
+                revoke=True,
+            ),
         )
 
         return self.api.chats[str(chat_id)]["antinsfw"][0]
 
+    @measured()
     @error_handler
     async def p__antitagall(
         self,
@@ -3625,12 +5804,12 @@ class HikariChatMod(loader.Module):
     ) -> Union[bool, str]:
         return (
             self.api.chats[str(chat_id)]["antitagall"][0]
-            if self.api.should_protect(chat_id, "antitagall")
-            and getattr(message, "text", False)
+            if getattr(message, "text", False)
             and message.text.count("tg://user?id=") >= 5
             else False
         )
 
+    @measured()
     @error_handler
     async def p__antihelp(
         self,
@@ -3639,9 +5818,7 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> bool:
-        if not self.api.should_protect(chat_id, "antihelp") or not getattr(
-            message, "text", False
-        ):
+        if not getattr(message, "text", False):
             return False
 
         search = message.text
@@ -3654,9 +5831,10 @@ class HikariChatMod(loader.Module):
         ):
             return False
 
-        await message.delete()
+        await self.rpc("delete", message.delete)
         return True
 
+    @measured()
     @error_handler
     async def p__antiarab(
         self,
@@ -3668,8 +5846,7 @@ class HikariChatMod(loader.Module):
         return (
             self.api.chats[str(chat_id)]["antiarab"][0]
             if (
-                self.api.should_protect(chat_id, "antiarab")
-                and (
+                (
                     getattr(message, "user_joined", False)
                     or getattr(message, "user_added", False)
                 )
@@ -3681,6 +5858,7 @@ class HikariChatMod(loader.Module):
             else False
         )
 
+    @measured()
     @error_handler
     async def p__antizalgo(
         self,
@@ -3692,8 +5870,7 @@ class HikariChatMod(loader.Module):
         return (
             self.api.chats[str(chat_id)]["antizalgo"]
             if (
-                self.api.should_protect(chat_id, "antizalgo")
-                and (
+                (
                     getattr(message, "user_joined", False)
                     or getattr(message, "user_added", False)
                 )
@@ -3709,6 +5886,7 @@ class HikariChatMod(loader.Module):
             else False
         )
 
+    @measured()
     @error_handler
     async def p__antistick(
         self,
@@ -3717,7 +5895,7 @@ class HikariChatMod(loader.Module):
         user: Union[User, Channel],
         message: Message,
     ) -> Union[bool, str]:
-        if not self.api.should_protect(chat_id, "antistick") or not (
+        if not (
             getattr(message, "sticker", False)
             or getattr(message, "media", False)
             and isinstance(message.media, MessageMediaUnsupported)
@@ -3737,23 +5915,33 @@ class HikariChatMod(loader.Module):
         if len(self._sticks_ratelimit[sender]) > self._sticks_limit:
             return self.api.chats[str(chat_id)]["antistick"][0]
 
+    @measured()
     @error_handler
     async def watcher(self, message: Message) -> None:
         if not isinstance(getattr(message, "chat", 0), (Chat, Channel)):
             return
 
         chat_id = utils.get_chat_id(message)
+        entity_cache.warm(message)
 
         if (
             isinstance(getattr(message, "chat", 0), Channel)
             and not getattr(message, "megagroup", False)
-            and int(chat_id) in reverse_dict(self._linked_channels)
+            and self._linked_channels.is_channel(int(chat_id))
         ):
-            actual_chat = str(reverse_dict(self._linked_channels)[int(chat_id)])
-            await self.p__antiservice(actual_chat, message)
+            actual_chat = self._linked_channels.chat(int(chat_id))
+            if self.api.should_protect(actual_chat, "antiservice"):
+                await self.p__antiservice(actual_chat, message)
+            return
+
+        plan = self.api.dispatch_plan(chat_id)
+
+        if not plan and not self.api.in_federation(chat_id):
             return
 
-        await self.p__antiservice(chat_id, message)
+        if plan[:1] == ("antiservice",):
+            await self.p__antiservice(chat_id, message)
+            plan = plan[1:]
 
         try:
             user_id = (
@@ -3775,9 +5963,10 @@ class HikariChatMod(loader.Module):
                         except Exception:
                             logger.debug(f"Can't extract entity from event {type(message)}")  # fmt: skip
                             return
+        peer_id = user_id
         user_id = int(str(user_id)[4:]) if str(user_id).startswith("-100") else int(user_id)  # fmt: skip
 
-        fed = await self.find_fed(message)
+        fed = self.api.find_fed(chat_id)
 
         if fed in self.api.feds:
             if (
@@ -3804,131 +5993,63 @@ class HikariChatMod(loader.Module):
                             True,
                         )
 
-                for note, note_info in self.api.feds[fed]["notes"].items():
-                    if str(note_info["creator"]) != str(self._me):
-                        continue
-
-                    if note.lower() in message.raw_text.lower():
-                        txt = note_info["text"]
-                        self._ratelimit["notes"][str(user_id)] = time.time() + 3
-
-                        if not txt.startswith("@inline"):
-                            await utils.answer(message, txt)
-                            break
+                for note in self.api.find_notes(fed, message.raw_text):
+                    txt, buttons = self.api.note_payload(fed, note)
+                    self._ratelimit["notes"][str(user_id)] = time.time() + 3
 
-                        txt = "\n".join(txt.splitlines()[1:])
-                        buttons = []
-                        button_re = r"\[(.+)\]\((https?://.*)\)"
-                        txt_r = []
-                        for line in txt.splitlines():
-                            if re.match(button_re, re.sub(r"<.*?>", "", line).strip()):
-                                match = re.search(
-                                    button_re, re.sub(r"<.*?>", "", line).strip()
-                                )
-                                buttons += [
-                                    [{"text": match.group(1), "url": match.group(2)}]
-                                ]
-                            else:
-                                txt_r += [line]
-
-                        if not buttons:
-                            await utils.answer(message, txt)
-                            break
+                    if not buttons:
+                        await self.rpc("send", lambda: utils.answer(message, txt))
+                        break
 
-                        await self.inline.form(
+                    await self.rpc(
+                        "send",
+                        lambda: self.inline.form(
                             message=message,
-                            text="\n".join(txt_r),
+                            text=txt,
                             reply_markup=buttons,
-                        )
+                        ),
+                    )
 
-            if int(user_id) in (
-                list(map(int, self.api.feds[fed]["fdef"]))
-                + list(self._linked_channels.values())
+            if int(user_id) in self.api.fdef(fed) or self._linked_channels.is_channel(
+                int(user_id)
             ):
                 return
 
-        if str(chat_id) not in self.api.chats or not self.api.chats[str(chat_id)]:
+        if not plan:
             return
 
         try:
-            if (
-                await self._client.get_permissions(chat_id, message.sender_id)
-            ).is_admin:
-
+            if await self._admins.is_admin(chat_id, message.sender_id):
                 return
-        # fmt: skip
         except Exception:
             pass
 
-        user = await self._client.get_entity(user_id)
-        chat = await message.get_chat()
+        user = await self.resolve_entity(peer_id)
+        chat = await self.resolve_entity(message.chat_id)
         user_name = get_full_name(user)
 
         args = (chat_id, user_id, user, message)
 
-        if await self.p__banninja(*args, chat):
-            return
-
-        if await self.p__antiraid(*args, chat):
-            return
-
-        r = await self.p__antiarab(*args)
-        if r:
-            await self.punish(chat_id, user, "arabic_nickname", r, user_name)
-            return
-
-        r = await self.p__antizalgo(*args)
-        if r:
-            await self.punish(chat_id, user, "zalgo", r, user_name)
-            return
-
-        if await self.p__welcome(*args, chat):
-            return
-
-        if getattr(message, "action", ""):
-            return
-
-        await self.p__report(*args)
-
-        r = await self.p__antiflood(*args)
-        if r:
-            await self.punish(chat_id, user, "flood", r, user_name)
-            await message.delete()
-            return
-
-        if await self.p__antichannel(*args):
-            return
+        for protection in plan:
+            violation, with_chat, delete, on_action = DISPATCH_ORDER[protection]
 
-        if await self.p__antigif(*args):
-            return
+            if not on_action and getattr(message, "action", ""):
+                return
 
-        r = await self.p__antistick(*args)
-        if r:
-            await self.punish(chat_id, user, "stick", r, user_name)
-            return
+            handler = getattr(self, f"p__{protection}")
+            r = await (handler(*args, chat) if with_chat else handler(*args))
 
-        if await self.p__antispoiler(*args):
-            return
+            if not r:
+                continue
 
-        r = await self.p__antiexplicit(*args)
-        if r:
-            await self.punish(chat_id, user, "explicit", r, user_name)
-            await message.delete()
-            return
+            if violation:
+                await self.punish(chat_id, user, violation, r, user_name)
 
-        r = await self.p__antinsfw(*args)
-        if r:
-            await self.punish(chat_id, user, "nsfw_content", r, user_name)
-            return
+            if delete:
+                await self.rpc("delete", message.delete)
 
-        r = await self.p__antitagall(*args)
-        if r:
-            await self.punish(chat_id, user, "tagall", r, user_name)
-            await message.delete()
             return
 
-        await self.p__antihelp(*args)
-
     async def client_ready(
         self,
         client: "TelegramClient",  # noqa
@@ -3948,7 +6069,17 @@ class HikariChatMod(loader.Module):
 
         self._my_protects = {}
 
-        self._linked_channels = {}
+        self._linked_channels = LinkedChannels()
+
+        self._admins = AdminRoster(client)
+        client.add_event_handler(
+            self._admins_watcher,
+            events.Raw([UpdateChannelParticipant, UpdateChatParticipantAdmin]),
+        )
+        client.add_event_handler(
+            self._entities_watcher,
+            events.Raw([UpdateUserName, UpdateChannel]),
+        )
         self._sticks_ratelimit = {}
         self._raid_cleaners = []
 
@@ -3959,17 +6090,44 @@ class HikariChatMod(loader.Module):
             (db.get(main.__name__, "command_prefix", False) or ".")[0]
         )
 
+        self._rpc = RPCScheduler()
+        self._rpc.start()
+
+        self.flood_cache = FloodCounter(
+            self.flood_timeout,
+            self.flood_threshold,
+            int(self.config["flood_cache_size"]),
+        )
+        self._flood_store = WriteBehindStore(
+            "flood_cache.json",
+            self.flood_cache.dump,
+        )
         try:
-            with open("flood_cache.json", "r") as f:
-                self.flood_cache = json.loads(f.read())
+            self.flood_cache.load(self._flood_store.load({}))
         except Exception:
-            self.flood_cache = {}
+            logger.debug("Can't restore AntiFlood state", exc_info=True)
+
+        self._flood_store.start()
 
+        self._nsfw_cache = VerdictCache()
+        self._albums = {}
+        self._nsfw_store = WriteBehindStore("nsfw_cache.json", self._nsfw_cache.dump)
         try:
-            with open("join_ratelimit.json", "r") as f:
-                self._join_ratelimit = json.loads(f.read())
+            self._nsfw_cache.load(self._nsfw_store.load({}))
         except Exception:
-            self._join_ratelimit = {}
+            logger.debug("Can't restore AntiNSFW verdicts", exc_info=True)
+
+        self._nsfw_store.start()
+
+        self._sweep_checkpoints = {}
+        self._sweep_store = WriteBehindStore(
+            "hikarichat_sweep.json",
+            lambda: self._sweep_checkpoints,
+        )
+        self._sweep_checkpoints = self._sweep_store.load({})
+        self._sweep_store.start()
+
+        self._join_ratelimit = JoinRateTracker()
 
         self._ban_ninja = db.get("HikariChat", "ban_ninja", {})
 